@@ -21,6 +21,10 @@ import numpy as np
 import matplotlib.pyplot as plt
 import argparse
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from numba import njit
+from scipy.signal import freqz
 
 from .channel import *
 from .tx import *
@@ -70,163 +74,226 @@ def main():
 
         rx_waveform_20mhz = tx_output[::2]
         rx_waveforms = [rx_waveform_20mhz]
-    elif args.iq is not None:
+    else:
+        mac_frame_bytes, tx_symbol_stream, fir_taps = None, None, None
+
+    if args.iq is not None:
         arr = np.fromfile(args.iq, dtype=np.complex64)
         rx_waveforms = encontrar_trechos(arr, limiar=.004, max_separacao=100, padding=50)
         #np.savez_compressed('record.npz', *rx_waveforms[:100])
     elif args.npz is not None:
         rx_waveforms = [arr for arr in np.load(args.npz).values()]
 
-    for rx_waveform_20mhz in rx_waveforms:
-        # 4. Código do Receptor
-        logging.info("Iniciando Receptor...")
-        corrected_symbols = ofdm_receiver(rx_waveform_20mhz,
-            sample_advance=args.sample_advance,
-            correct_frequency_offset=args.correct_frequency_offset,
-            number_of_ofdm_symbols=1000,
-            use_max_ratio_combining=args.use_max_ratio_combining)
-        logging.info("Recepção concluída.")
-
-        if corrected_symbols.size == 0:
-            logging.warning("A recepção falhou. Pulando quadro.")
-            continue
-
-        # Decodifica quadro
-        decoded_params = decode_signal_field(corrected_symbols[:48])
-        print("\n--- Decodificação do Campo SIGNAL ---")
-        print(f"Taxa de transmissão: {decoded_params['rate_info']['name']} ({decoded_params['rate_info']['Mbps']} Mbps)")
-        print(f"Comprimento do PSDU: {decoded_params['length']} bytes")
-        print(f"Verificação de Paridade: {'OK' if decoded_params['parity_ok'] else 'FALHOU'}")
-        print(f"Verificação da Cauda: {'OK' if decoded_params['tail_ok'] else 'FALHOU'}")
-        print()
-
-        print("--- Decodificação dos Dados ---")
-        received_mac_frame_bytes, tail_ok, crc_ok = decode_data_symbols(corrected_symbols[48:], decoded_params['rate_info'], decoded_params['length'])
-        if args.testbench:
-            print(f"Bytes iguais aos originais: {np.sum(received_mac_frame_bytes == mac_frame_bytes)/len(mac_frame_bytes):.1%}")
-        else:
-            print(bytes(received_mac_frame_bytes))
-        print(f"Verificação da Cauda: {'OK' if tail_ok else 'FALHOU'}")
-        print(f"Verificação de CRC: {'OK' if crc_ok else 'FALHOU'}")
-        print()
-
-        if args.testbench:
-            # 5. Avaliação de Desempenho
-            logging.info("Avaliando desempenho...")
-            error_vectors = tx_symbol_stream - corrected_symbols
-            average_error_vector_power = np.mean(np.abs(error_vectors)**2)
-
-            # Evita log de zero
-            if average_error_vector_power == 0:
-                average_error_vector_power = 1e-12
-
-            evm = 10 * np.log10(average_error_vector_power / 1)
-            print(f"EVM = {evm:.4f} dB")
-
-            # Cálculo do EVM vs. Tempo
-            num_processed_symbols = len(corrected_symbols) // 48
-            error_time = np.zeros(num_processed_symbols)
-            for i in range(num_processed_symbols):
-                start = i * 48
-                stop = start + 48
-                current_symbol = corrected_symbols[start:stop]
-                ideal_symbol = tx_symbol_stream[start:stop]
-                error_vector = ideal_symbol - current_symbol
-                error_time[i] = np.mean(np.abs(error_vector)**2)
-
-            # Cálculo do EVM vs. Frequência
-            error_frequency = np.zeros(48)
-            for i in range(num_processed_symbols):
-                start = i * 48
-                stop = start + 48
-                current_symbol = corrected_symbols[start:stop]
-                ideal_symbol = tx_symbol_stream[start:stop]
-                error_vector = ideal_symbol - current_symbol
-                error_frequency += (np.abs(error_vector)**2) / num_processed_symbols
-
-            error_frequency[error_frequency == 0] = 1e-12
-            evm_frequency = 10 * np.log10(error_frequency)
-
-            error_time[error_time == 0] = 1e-12
-            evm_time = 10 * np.log10(error_time)
-
-            # Índices para o gráfico de frequência
-            pos_index = np.concatenate((np.arange(1, 7), np.arange(8, 21), np.arange(22, 27)))
-            neg_index = np.concatenate((np.arange(38, 43), np.arange(44, 57), np.arange(58, 64))) - 64
-
-            # Resposta de frequência do filtro FIR
-            f = np.arange(-0.5, 0.501, 0.001)
-            n = np.arange(len(fir_taps))
-            response = np.zeros(len(f), dtype=complex)
-            for d_idx, d_val in enumerate(f):
-                E = np.exp(1j * 2 * np.pi * n * d_val)
-                response[d_idx] = np.dot(fir_taps, E.conj().T)
-
-            mag_response = 20 * np.log10(np.abs(response))
-            mag_response_norm = mag_response - np.max(mag_response)
-
-            # Plotagem dos resultados
-            fig, axs = plt.subplots(2, 2, figsize=(14, 10))
-            fig.suptitle('Análise de Desempenho do Modem OFDM', fontsize=16)
-
-            # EVM vs Frequência
-            axs[0, 0].plot(pos_index, evm_frequency[:24], 'k.')
-            axs[0, 0].plot(neg_index, evm_frequency[24:], 'k.')
-            axs[0, 0].set_title('EVM vs. Frequência')
-            axs[0, 0].set_xlabel('Tons (Subportadoras)')
-            axs[0, 0].set_ylabel('dB')
-            axs[0, 0].set_xlim(-27, 27)
-            axs[0, 0].set_ylim(-40, 5)
-            axs[0, 0].grid(True)
-
-            # EVM vs Tempo
-            axs[0, 1].plot(evm_time, 'k')
-            axs[0, 1].set_title('EVM vs. Tempo')
-            axs[0, 1].set_xlabel('Símbolos')
-            axs[0, 1].set_ylabel('dB')
-            if len(evm_time) > 1:
-              axs[0, 1].set_xlim(0, len(evm_time) -1)
-            axs[0, 1].set_ylim(-40, -10)
-            axs[0, 1].grid(True)
-
-            # Resposta de Magnitude do Filtro de Múltiplos Percursos
-            axs[1, 0].plot(f, mag_response_norm, 'k')
-            axs[1, 0].set_title('Resposta de Magnitude do Filtro de Múltiplos Percursos')
-            axs[1, 0].set_xlabel('Frequência Normalizada')
-            axs[1, 0].set_ylabel('dB')
-            axs[1, 0].set_xlim(-13/64, 13/64)
-            axs[1, 0].set_ylim(-25, 5)
-            axs[1, 0].grid(True)
-
-            # Coeficientes FIR
-            axs[1, 1].stem(np.abs(fir_taps), linefmt='k-', markerfmt='k.', basefmt='k-')
-            axs[1, 1].set_title('Coeficientes do Filtro FIR (Magnitude)')
-            axs[1, 1].set_xlabel('Amostras')
-            axs[1, 1].grid(True)
-
-            plt.tight_layout(rect=[0, 0, 1, 0.96])
-
-        # Gráfico da Constelação
-        plt.figure(figsize=(8, 8))
-        plt.plot(np.real(corrected_symbols[:48]), np.imag(corrected_symbols[:48]), 'k.', markersize=8)
-        plt.title('Constelação Recebida Após Equalização (SIGNAL symbol)')
-        plt.xlabel('Real')
-        plt.ylabel('Imaginário')
-        plt.grid(True)
-        plt.axis('square')
-        plt.xlim(-1.5, 1.5)
-        plt.ylim(-1.5, 1.5)
-
-        plt.figure(figsize=(8, 8))
-        plt.plot(np.real(corrected_symbols[48:]), np.imag(corrected_symbols[48:]), 'k.', markersize=8)
-        plt.title('Constelação Recebida Após Equalização (DATA symbols)')
-        plt.xlabel('Real')
-        plt.ylabel('Imaginário')
-        plt.grid(True)
-        plt.axis('square')
-        plt.xlim(-1.5, 1.5)
-        plt.ylim(-1.5, 1.5)
-        plt.show()
+    # 4. Código do Receptor. Cada quadro é independente; com vários quadros
+    # (gravações de SDR), a recepção e a decodificação são distribuídas entre
+    # processos, e apenas a impressão e os gráficos ficam no processo principal.
+    receber = partial(_receber_quadro,
+        sample_advance=args.sample_advance,
+        correct_frequency_offset=args.correct_frequency_offset,
+        use_max_ratio_combining=args.use_max_ratio_combining)
+
+    if len(rx_waveforms) > 1:
+        with ProcessPoolExecutor() as executor:
+            for resultado in executor.map(receber, rx_waveforms, chunksize=4):
+                _exibir_quadro(args, resultado, mac_frame_bytes, tx_symbol_stream, fir_taps)
+    else:
+        for resultado in map(receber, rx_waveforms):
+            _exibir_quadro(args, resultado, mac_frame_bytes, tx_symbol_stream, fir_taps)
+
+def _receber_quadro(rx_waveform_20mhz, sample_advance, correct_frequency_offset, use_max_ratio_combining):
+    """
+    Recebe e decodifica um quadro. Retorna `None` se a recepção falhar ou uma
+    tupla `(corrected_symbols, decoded_params, received_mac_frame_bytes,
+    tail_ok, crc_ok)`.
+    """
+    logging.info("Iniciando Receptor...")
+    corrected_symbols = ofdm_receiver(rx_waveform_20mhz,
+        sample_advance=sample_advance,
+        correct_frequency_offset=correct_frequency_offset,
+        number_of_ofdm_symbols=1000,
+        use_max_ratio_combining=use_max_ratio_combining)
+    logging.info("Recepção concluída.")
+
+    if corrected_symbols.size == 0:
+        return None
+
+    # Decodifica quadro
+    decoded_params = decode_signal_field(corrected_symbols[:48])
+    received_mac_frame_bytes, tail_ok, crc_ok = decode_data_symbols(corrected_symbols[48:], decoded_params['rate_info'], decoded_params['length'])
+    return corrected_symbols, decoded_params, received_mac_frame_bytes, tail_ok, crc_ok
+
+def _exibir_quadro(args, resultado, mac_frame_bytes, tx_symbol_stream, fir_taps):
+    """
+    Imprime a decodificação de um quadro e, no testbench, avalia o desempenho.
+    Também exibe as constelações recebidas.
+    """
+    if resultado is None:
+        logging.warning("A recepção falhou. Pulando quadro.")
+        return
+    corrected_symbols, decoded_params, received_mac_frame_bytes, tail_ok, crc_ok = resultado
+
+    print("\n--- Decodificação do Campo SIGNAL ---")
+    print(f"Taxa de transmissão: {decoded_params['rate_info']['name']} ({decoded_params['rate_info']['Mbps']} Mbps)")
+    print(f"Comprimento do PSDU: {decoded_params['length']} bytes")
+    print(f"Verificação de Paridade: {'OK' if decoded_params['parity_ok'] else 'FALHOU'}")
+    print(f"Verificação da Cauda: {'OK' if decoded_params['tail_ok'] else 'FALHOU'}")
+    print()
+
+    print("--- Decodificação dos Dados ---")
+    if args.testbench:
+        print(f"Bytes iguais aos originais: {np.sum(received_mac_frame_bytes == mac_frame_bytes)/len(mac_frame_bytes):.1%}")
+    else:
+        print(bytes(received_mac_frame_bytes))
+    print(f"Verificação da Cauda: {'OK' if tail_ok else 'FALHOU'}")
+    print(f"Verificação de CRC: {'OK' if crc_ok else 'FALHOU'}")
+    print()
+
+    if args.testbench:
+        # 5. Avaliação de Desempenho
+        logging.info("Avaliando desempenho...")
+        error_vectors = tx_symbol_stream - corrected_symbols
+        average_error_vector_power = np.mean(squared_magnitude(error_vectors))
+
+        # Evita log de zero
+        if average_error_vector_power == 0:
+            average_error_vector_power = 1e-12
+
+        evm = 10 * np.log10(average_error_vector_power / 1)
+        print(f"EVM = {evm:.4f} dB")
+
+        # Potência do erro organizada como (símbolo OFDM, subportadora): a
+        # média ao longo das linhas dá o EVM vs. tempo e ao longo das
+        # colunas, o EVM vs. frequência.
+        num_processed_symbols = len(corrected_symbols) // 48
+        num_processed_samples = num_processed_symbols * 48
+        error_matrix = (tx_symbol_stream[:num_processed_samples] -
+                        corrected_symbols[:num_processed_samples]).reshape(num_processed_symbols, 48)
+        error_power = squared_magnitude(error_matrix)
+
+        # Cálculo do EVM vs. Tempo
+        error_time = error_power.mean(axis=1)
+
+        # Cálculo do EVM vs. Frequência
+        error_frequency = error_power.mean(axis=0)
+
+        error_frequency[error_frequency == 0] = 1e-12
+        evm_frequency = 10 * np.log10(error_frequency)
+
+        error_time[error_time == 0] = 1e-12
+        evm_time = 10 * np.log10(error_time)
+
+        # Índices para o gráfico de frequência
+        pos_index = np.concatenate((np.arange(1, 7), np.arange(8, 21), np.arange(22, 27)))
+        neg_index = np.concatenate((np.arange(38, 43), np.arange(44, 57), np.arange(58, 64))) - 64
+
+        # Resposta de frequência do filtro FIR. Com `worN` potência de 2, o
+        # `freqz` calcula a DTFT por uma FFT com zero-padding. A grade [0, 1)
+        # é reordenada para frequências normalizadas em [-0.5, 0.5).
+        w, h = freqz(fir_taps, worN=1024, whole=True)
+        f = np.fft.fftshift(w / (2 * np.pi))
+        f[f >= 0.5] -= 1
+        response = np.fft.fftshift(h)
+
+        mag_response = 10 * np.log10(squared_magnitude(response))
+        mag_response_norm = mag_response - np.max(mag_response)
+
+        # Plotagem dos resultados
+        fig, axs = plt.subplots(2, 2, figsize=(14, 10))
+        fig.suptitle('Análise de Desempenho do Modem OFDM', fontsize=16)
+
+        # EVM vs Frequência
+        axs[0, 0].plot(pos_index, evm_frequency[:24], 'k.')
+        axs[0, 0].plot(neg_index, evm_frequency[24:], 'k.')
+        axs[0, 0].set_title('EVM vs. Frequência')
+        axs[0, 0].set_xlabel('Tons (Subportadoras)')
+        axs[0, 0].set_ylabel('dB')
+        axs[0, 0].set_xlim(-27, 27)
+        axs[0, 0].set_ylim(-40, 5)
+        axs[0, 0].grid(True)
+
+        # EVM vs Tempo
+        axs[0, 1].plot(evm_time, 'k')
+        axs[0, 1].set_title('EVM vs. Tempo')
+        axs[0, 1].set_xlabel('Símbolos')
+        axs[0, 1].set_ylabel('dB')
+        if len(evm_time) > 1:
+          axs[0, 1].set_xlim(0, len(evm_time) -1)
+        axs[0, 1].set_ylim(-40, -10)
+        axs[0, 1].grid(True)
+
+        # Resposta de Magnitude do Filtro de Múltiplos Percursos
+        axs[1, 0].plot(f, mag_response_norm, 'k')
+        axs[1, 0].set_title('Resposta de Magnitude do Filtro de Múltiplos Percursos')
+        axs[1, 0].set_xlabel('Frequência Normalizada')
+        axs[1, 0].set_ylabel('dB')
+        axs[1, 0].set_xlim(-13/64, 13/64)
+        axs[1, 0].set_ylim(-25, 5)
+        axs[1, 0].grid(True)
+
+        # Coeficientes FIR
+        axs[1, 1].stem(np.abs(fir_taps), linefmt='k-', markerfmt='k.', basefmt='k-')
+        axs[1, 1].set_title('Coeficientes do Filtro FIR (Magnitude)')
+        axs[1, 1].set_xlabel('Amostras')
+        axs[1, 1].grid(True)
+
+        plt.tight_layout(rect=[0, 0, 1, 0.96])
+
+    # Gráfico da Constelação
+    plt.figure(figsize=(8, 8))
+    plt.plot(np.real(corrected_symbols[:48]), np.imag(corrected_symbols[:48]), 'k.', markersize=8)
+    plt.title('Constelação Recebida Após Equalização (SIGNAL symbol)')
+    plt.xlabel('Real')
+    plt.ylabel('Imaginário')
+    plt.grid(True)
+    plt.axis('square')
+    plt.xlim(-1.5, 1.5)
+    plt.ylim(-1.5, 1.5)
+
+    plt.figure(figsize=(8, 8))
+    plt.plot(np.real(corrected_symbols[48:]), np.imag(corrected_symbols[48:]), 'k.', markersize=8)
+    plt.title('Constelação Recebida Após Equalização (DATA symbols)')
+    plt.xlabel('Real')
+    plt.ylabel('Imaginário')
+    plt.grid(True)
+    plt.axis('square')
+    plt.xlim(-1.5, 1.5)
+    plt.ylim(-1.5, 1.5)
+    plt.show()
+
+@njit(cache=True, boundscheck=False)
+def _encontrar_limites(real, imag, limiar2, max_separacao, padding, n):
+    """
+    Percorre a gravação uma única vez e devolve um array `(num_trechos, 2)` com
+    os limites `(inicio, fim)` de cada trecho, já acrescidos do `padding`.
+    Comparar `|z|^2` com `limiar^2` evita a raiz quadrada de `np.abs` e nenhum
+    vetor intermediário do tamanho da entrada é alocado.
+    """
+    # Cada trecho tem ao menos uma amostra e é seguido de uma lacuna de pelo
+    # menos `max_separacao + 1` amostras, o que limita o número de trechos e
+    # permite pré-alocar a saída.
+    limites = np.empty((n // (max_separacao + 2) + 1, 2), dtype=np.int64)
+    num_trechos = 0
+    inicio_trecho = -1
+    ultimo_acima = -1
+
+    for i in range(n):
+        if real[i] * real[i] + imag[i] * imag[i] > limiar2:
+            if inicio_trecho < 0:
+                inicio_trecho = i
+            elif i - ultimo_acima > max_separacao + 1:
+                # Lacuna maior que max_separacao + 1 encerra o trecho atual.
+                limites[num_trechos, 0] = max(0, inicio_trecho - padding)
+                limites[num_trechos, 1] = min(n - 1, ultimo_acima + padding) + 1
+                num_trechos += 1
+                inicio_trecho = i
+            ultimo_acima = i
+
+    if inicio_trecho >= 0:
+        limites[num_trechos, 0] = max(0, inicio_trecho - padding)
+        limites[num_trechos, 1] = min(n - 1, ultimo_acima + padding) + 1
+        num_trechos += 1
+
+    return limites[:num_trechos]
 
 def encontrar_trechos(arr: np.ndarray, limiar: float, max_separacao: int, padding: int) -> list:
     """
@@ -245,22 +312,14 @@ def encontrar_trechos(arr: np.ndarray, limiar: float, max_separacao: int, paddin
         satisfaz as condições.
     """
     # Agrupa regiões de energia acima do limiar, permitindo lacunas curtas entre
-    # amostras ativas para não quebrar um mesmo quadro capturado.
-    indices_acima_limiar = np.where(np.abs(arr) > limiar)[0]
-
-    if len(indices_acima_limiar) == 0:
-        return []
-
-    diferencas = np.diff(indices_acima_limiar)
-
-    # Diferenças maiores que max_separacao + 1 indicam uma quebra de trecho.
-    pontos_de_quebra = np.where(diferencas > max_separacao + 1)[0]
-
-    grupos_de_indices = np.split(indices_acima_limiar, pontos_de_quebra + 1)
-
-    trechos = [arr[max(0, grupo[0]-padding):min(len(arr)-1, grupo[-1]+padding) + 1] for grupo in grupos_de_indices if grupo.size > 0]
-
-    return trechos
+    # amostras ativas para não quebrar um mesmo quadro capturado. A varredura
+    # compilada devolve apenas os limites; os trechos são fatias (views) de `arr`.
+    # O limiar ao quadrado é passado no mesmo tipo das amostras (float32 para
+    # gravações complex64), para que a comparação não promova cada amostra.
+    limiar2 = arr.real.dtype.type(limiar * limiar)
+    limites = _encontrar_limites(arr.real, arr.imag, limiar2, max_separacao, padding, len(arr))
+
+    return [arr[inicio:fim] for inicio, fim in limites.tolist()]
 
 if __name__ == '__main__':
     main()
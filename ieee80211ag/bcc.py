@@ -51,22 +51,41 @@ def _make_transition_tables():
 
 NEXT_STATE_TABLE, EXPECTED_TABLE = _make_transition_tables()
 
+# Os mesmos bits codificados esperados, em 0/1, para o codificador.
+OUTPUT_TABLE = ((EXPECTED_TABLE + 1) // 2).astype(np.uint8)
 
-def encode_bits(bits):
-    """Codifica uma sequência de bits com o código IEEE 802.11 K=7, taxa 1/2."""
+
+@njit(cache=True)
+def _encode_bits_numba(bits, next_state_table, output_table):
+    """Núcleo do codificador compilado com Numba.
+
+    Percorre a treliça a partir do estado zero: cada bit de entrada seleciona
+    um ramo, cujos dois bits codificados e estado de destino já estão nas
+    tabelas pré-calculadas.
+    """
+    output = np.empty(2 * bits.shape[0], dtype=np.uint8)
     state = 0
-    output = []
 
-    for bit in bits:
-        input_bit = int(bit) & 1
-        register = (input_bit << (CONSTRAINT_LENGTH - 1)) | state
-        output.append(_parity(register & GENERATORS[0]))
-        output.append(_parity(register & GENERATORS[1]))
-        state = ((input_bit << (CONSTRAINT_LENGTH - 2)) | (state >> 1)) & (NUM_STATES - 1)
+    for step in range(bits.shape[0]):
+        input_bit = bits[step] & 1
+        output[2 * step] = output_table[state, input_bit, 0]
+        output[2 * step + 1] = output_table[state, input_bit, 1]
+        state = next_state_table[state, input_bit]
 
     return output
 
 
+def encode_bits(bits):
+    """Codifica uma sequência de bits com o código IEEE 802.11 K=7, taxa 1/2.
+
+    Devolve um vetor `uint8` com dois bits codificados por bit de entrada.
+    Aceita qualquer vetor de inteiros (tipicamente `uint8`) sem convertê-lo: o
+    núcleo usa apenas o bit menos significativo de cada elemento.
+    """
+    bits = np.ascontiguousarray(bits).ravel()
+    return _encode_bits_numba(bits, NEXT_STATE_TABLE, OUTPUT_TABLE)
+
+
 @njit(cache=True)
 def _decode_soft_numba(soft, next_state_table, expected_table):
     """Núcleo Viterbi soft-decision compilado com Numba.
@@ -3,10 +3,13 @@
 # =============================================================================
 
 import numpy as np
-from scipy.signal import lfilter
+from fractions import Fraction
+from functools import lru_cache
+from scipy.signal import convolve, firwin, lfilter, resample_poly
 from scipy.signal.windows import hann
-from scipy.interpolate import CubicSpline
 import logging
+from numba import njit, prange
+from .common import squared_magnitude
 
 DEFECT_MODE = {
     'Multipath': 1,
@@ -34,6 +37,11 @@ DEFECT_SETTINGS = {
     'Drift_ppm': -80,
 }
 
+# Maior fator up/down aceito por `cause_timing_drift` para reamostrar com
+# filtro polifásico (o filtro tem 20 taps por unidade do fator; -80 ppm usa
+# 12500). Razões que exigiriam fatores maiores usam `_fractional_resample`.
+_MAX_RESAMPLING_RATE = 20_000
+
 def default_defect_model(tx_samples):
     return defect_model(tx_samples, DEFECT_SETTINGS, DEFECT_MODE)
 
@@ -43,10 +51,18 @@ def defect_model(tx_samples, settings, mode):
     Esta função modela as imperfeições do mundo real de um canal de comunicação sem fio.
     Referência: Livro-texto, Capítulo 6, Figura 6-16.
     """
+    # Toda a cascata opera em precisão simples (complex64): o EVM de interesse
+    # fica em torno de -30 dB, muito acima do erro de arredondamento de float32,
+    # e cada etapa passa a mover metade dos bytes.
+    tx_samples = np.asarray(tx_samples, dtype=np.complex64)
+
     # Múltiplos percursos
     fir_taps = get_multipath_filter(settings['SampleRate'], settings['DelaySpread'], settings['NumberOfTaps'])
     if mode['Multipath'] == 1:
-        tx_samples = lfilter(fir_taps, [1.0], tx_samples)
+        # Convolução FIR truncada ao comprimento da entrada (equivale a
+        # `lfilter(fir_taps, [1.0], tx_samples)`). `convolve` escolhe entre a
+        # convolução direta e a via FFT conforme o número de taps.
+        tx_samples = convolve(tx_samples, fir_taps.astype(np.complex64))[:len(tx_samples)]
         var_output = np.var(tx_samples)
         if var_output > 0:
              tx_samples /= np.sqrt(var_output)
@@ -55,27 +71,33 @@ def defect_model(tx_samples, settings, mode):
     if mode['ThermalNoise'] == 1:
         tx_samples += generate_awgn(tx_samples, settings['SNR_dB'])
 
-    # Ruído de fase
+    # Ruído de fase, deslocamento de frequência e desequilíbrio de I/Q atuam
+    # amostra a amostra e aparecem em sequência na cascata; são aplicados numa
+    # única passada por `_apply_pointwise_defects`. Um defeito desabilitado é
+    # passado como identidade (fase nula, ganhos unitários); se os três estão
+    # desabilitados, a passada é omitida.
+    phase_noise = np.zeros(0)
     if mode['PhaseNoise'] == 1:
         number_of_samples = len(tx_samples)
         ph_noise, rmsn = phase_noise_generator(settings['SampleRate'], number_of_samples,
                                            settings['PhaseNoiseProfile'][1, :],
                                            settings['PhaseNoiseProfile'][0, :])
         ph_noise -= np.mean(ph_noise)
-        phase_noise_signal = np.exp(1j * ph_noise)
         logging.info(f"Integrated Phase Noise1: {rmsn * 57.3}")
-        tx_samples *= phase_noise_signal
+        phase_noise = np.real(ph_noise)
 
-    # Deslocamento de frequência
+    omega = 0.0
     if mode['Freq_Offset'] == 1:
-        offset_signal = np.exp(1j * 2 * np.pi * np.arange(1, len(tx_samples) + 1) * settings['FrequencyOffset'] / settings['SampleRate'])
-        tx_samples *= offset_signal
+        omega = 2 * np.pi * settings['FrequencyOffset'] / settings['SampleRate']
 
-    # Desequilíbrio de I/Q
+    i_gain, q_gain, phase_imbalance = 1.0, 1.0, 0.0
     if mode['IQ_Imbalance'] == 1:
         i_gain = 10**(0.5 * settings['AmplitudeImbalance_dB'] / 20)
         q_gain = 10**(-0.5 * settings['AmplitudeImbalance_dB'] / 20)
-        tx_samples = iq_imbalance(tx_samples, settings['PhaseImbalance'], i_gain, q_gain)
+        phase_imbalance = settings['PhaseImbalance']
+
+    if mode['PhaseNoise'] == 1 or mode['Freq_Offset'] == 1 or mode['IQ_Imbalance'] == 1:
+        tx_samples = _apply_pointwise_defects(tx_samples, phase_noise, omega, i_gain, q_gain, phase_imbalance)
 
     # Deslocamento de temporização
     if mode['TimingOffset'] == 1 and len(tx_samples) > abs(settings['Sample_Offset']) + 2:
@@ -88,32 +110,140 @@ def defect_model(tx_samples, settings, mode):
     output_waveform = tx_samples
     return output_waveform, fir_taps
 
+@njit(parallel=True, fastmath=True, cache=True)
+def _apply_pointwise_defects(tx_samples, phase_noise, omega, i_gain, q_gain, phase_imbalance):
+    """
+    Aplica, numa única passada paralela, o ruído de fase `phase_noise` (ignorado
+    se vazio), o deslocamento de frequência `exp(1j*omega*n)` com `n` a partir
+    de 1 e o modelo de `iq_imbalance`. As duas rotações são somadas numa única
+    fase, de modo que cada amostra custa um seno e um cosseno. A fase é
+    acumulada em float64; a saída mantém o tipo de `tx_samples`.
+    `iq_imbalance` continua sendo a implementação de referência do modelo.
+    """
+    n = tx_samples.shape[0]
+    use_phase_noise = phase_noise.shape[0] == n
+    q_cos = q_gain * np.cos(phase_imbalance)
+    q_sin = q_gain * np.sin(phase_imbalance)
+    output = np.empty_like(tx_samples)
+
+    for i in prange(n):
+        phase = omega * (i + 1)
+        if use_phase_noise:
+            phase += phase_noise[i]
+        c = np.cos(phase)
+        s = np.sin(phase)
+
+        i_in = tx_samples[i].real * c - tx_samples[i].imag * s
+        q_in = tx_samples[i].real * s + tx_samples[i].imag * c
+        output[i] = complex(i_gain * i_in, q_cos * q_in + q_sin * i_in)
+
+    return output
+
 def cause_timing_drift(input_seq, drift):
     """
     Simula a deriva de temporização (timing drift) em um sinal.
     A deriva de temporização ocorre devido a pequenas diferenças entre as frequências
     dos osciladores de referência do transmissor e do receptor (e.g., TCXO).
     Isso causa uma compressão ou expansão gradual da forma de onda no tempo.
-    A função interpola o sinal de entrada em novos pontos de tempo para simular este efeito.
+    A função reamostra o sinal de entrada nos novos pontos de tempo para simular este efeito.
     Referência: Livro-texto, Seção 6.3.7, "Timing Drift".
     Referência Norma IEEE 802.11a: A tolerância do relógio de símbolo é de +/- 20 ppm (Seção 17.3.9.5).
     """
     # Calcula o novo passo de amostragem. Um drift positivo significa que o relógio
     # do transmissor é mais rápido que o do receptor, então "pulamos" amostras.
     sample_step = 1 + drift / 1e6
-    input_index = np.arange(1, len(input_seq) + 1)
-    # Gera os novos instantes de tempo onde o sinal será amostrado
-    output_index = np.arange(1, len(input_seq) + 1, sample_step)
+    # Número de instantes 1, 1 + sample_step, ... que caem dentro dos dados de entrada.
+    number_of_outputs = int(np.floor((len(input_seq) - 1) / sample_step)) + 1
+
+    # Drift nulo: os instantes de saída coincidem com as amostras de entrada.
+    if sample_step == 1:
+        return input_seq[:number_of_outputs].copy()
+
+    # Um passo constante equivale a reamostrar pela razão racional up/down =
+    # 1/sample_step. Quando essa razão tem denominador pequeno (e.g., -80 ppm
+    # -> 12500/12499), o filtro polifásico substitui o spline cúbico global,
+    # herdado do `interp1` do MATLAB, por uma convolução FIR contígua. Para
+    # outros valores (e.g., 7 ppm -> 1000007/1000000, ou ppm não inteiro) o
+    # filtro teria milhões de taps; nesse caso cada instante é interpolado
+    # diretamente por `_fractional_resample`.
+    ratio = Fraction(sample_step).limit_denominator(_MAX_RESAMPLING_RATE)
+    if abs(ratio - Fraction(sample_step)) > 1e-12:
+        return _fractional_resample(input_seq, sample_step, number_of_outputs)
+    up, down = ratio.denominator, ratio.numerator
+    # Taps no tipo real da entrada, para que um sinal complex64 seja filtrado em
+    # precisão simples.
+    taps = _resampling_filter(up, down).astype(np.real(input_seq).dtype, copy=False)
+    output = resample_poly(input_seq, up, down, window=taps)
+    return output[:number_of_outputs]
+
+def _fractional_resample(input_seq, sample_step, number_of_outputs):
+    """
+    Interpola `input_seq` nos instantes `m * sample_step`, `m = 0, 1, ...`, com
+    o mesmo sinc janelado (Hann) de `cause_timing_offset`. Os taps vêm de um
+    banco pré-calculado, indexado pela parte fracionária de cada instante.
+    """
+    input_seq = np.ascontiguousarray(input_seq)
+    tap_bank = _fractional_delay_taps(input_seq.real.dtype)
+    return _fractional_resample_numba(input_seq, sample_step, number_of_outputs, tap_bank)
 
-    # Garante que os pontos de interpolação estejam dentro dos limites dos dados de entrada.
-    output_index = output_index[output_index <= len(input_seq)]
-    output_index = output_index[(output_index >= input_index[0]) & (output_index <= input_index[-1])]
+@lru_cache(maxsize=4)
+def _fractional_delay_taps(dtype, num_phases=1024, half_length=8):
+    """
+    Banco de filtros de atraso fracionário: a linha `p` contém os `2*half_length`
+    taps do sinc janelado para o atraso `p / num_phases`. Com 1024 fases, o erro
+    de quantização do atraso (no máximo 1/2048 de amostra) fica bem abaixo do
+    ruído térmico simulado.
+    """
+    k = np.arange(-half_length + 1, half_length + 1)
+    offset = k - (np.arange(num_phases) / num_phases)[:, None]
+    taps = np.sinc(offset) * 0.5 * (1 + np.cos(np.pi * offset / half_length))
+    taps = taps.astype(dtype)
+    taps.setflags(write=False)
+    return taps
+
+@njit(cache=True)
+def _fractional_resample_numba(input_seq, sample_step, number_of_outputs, tap_bank):
+    """
+    Núcleo de `_fractional_resample`: para cada instante, escolhe a fase mais
+    próxima no banco e aplica seus taps às amostras vizinhas. Amostras fora da
+    entrada valem zero.
+    """
+    num_phases, num_taps = tap_bank.shape
+    first_tap = 1 - num_taps // 2
+    n = input_seq.shape[0]
+    output = np.empty(number_of_outputs, dtype=input_seq.dtype)
+
+    for m in range(number_of_outputs):
+        t = m * sample_step
+        base = int(np.floor(t))
+        phase = int(np.floor((t - base) * num_phases + 0.5))
+        if phase == num_phases:
+            phase = 0
+            base += 1
+
+        acc = 0j
+        for j in range(num_taps):
+            idx = base + first_tap + j
+            if idx >= 0 and idx < n:
+                acc += input_seq[idx] * tap_bank[phase, j]
+        output[m] = acc
 
-    # Usa a interpolação por spline cúbico para estimar os valores nos novos pontos.
-    cs = CubicSpline(input_index, input_seq)
-    output = cs(output_index)
     return output
 
+@lru_cache(maxsize=16)
+def _resampling_filter(up, down):
+    """
+    Projeta (uma única vez por razão up/down) o mesmo FIR passa-baixas que
+    `resample_poly` projetaria internamente. Para razões próximas de 1 o filtro
+    tem centenas de milhares de taps, e projetá-lo custa mais que a filtragem.
+    Exige `up != down`: com razão 1 o corte cairia em Nyquist e `firwin` falha.
+    """
+    max_rate = max(up, down)
+    taps = firwin(2 * 10 * max_rate + 1, 1 / max_rate, window=('kaiser', 5.0))
+    # O resultado é compartilhado pelo cache; protege-o contra escrita.
+    taps.setflags(write=False)
+    return taps
+
 def cause_timing_offset(input_seq, sample_delay):
     """
     Simula um deslocamento de temporização (timing offset) estático em um sinal.
@@ -121,16 +251,23 @@ def cause_timing_offset(input_seq, sample_delay):
     A função usa interpolação para reamostrar o sinal com o deslocamento desejado.
     Referência: Livro-texto, Seção 6.3.7, "Timing Offset" e Figura 6-50.
     """
-    sample_step = 1
-    input_index = np.arange(1, len(input_seq) + 1)
-    output_index = np.arange(1 + sample_delay, len(input_seq) + 1, sample_step)
-
-    # Garante que os pontos de interpolação estejam dentro dos limites dos dados de entrada.
-    output_index = output_index[(output_index >= input_index[0]) & (output_index <= input_index[-1])]
-
-    cs = CubicSpline(input_index, input_seq)
-    output = cs(output_index)
-    return output
+    # Os instantes de saída são `sample_delay + m`, restritos ao intervalo dos
+    # dados de entrada. A parte inteira do atraso é só uma fatia; a parte
+    # fracionária exige interpolação.
+    whole_delay = int(np.floor(sample_delay))
+    fractional_delay = sample_delay - whole_delay
+    first = max(whole_delay, 0)
+    if fractional_delay == 0:
+        return input_seq[first:]
+
+    # Filtro FIR de atraso fracionário: sinc deslocado, com janela de Hann
+    # centrada no instante interpolado. `output[i]` estima `input_seq(i + frac)`.
+    half_length = 8
+    k = np.arange(-half_length + 1, half_length + 1)
+    taps = np.sinc(k - fractional_delay) * 0.5 * (1 + np.cos(np.pi * (k - fractional_delay) / half_length))
+    taps = taps.astype(np.real(input_seq).dtype, copy=False)
+    interpolated = np.convolve(input_seq, taps[::-1])[half_length:half_length + len(input_seq)]
+    return interpolated[first:len(input_seq) - 1]
 
 def generate_awgn(input_seq, snr):
     """
@@ -140,15 +277,23 @@ def generate_awgn(input_seq, snr):
     Referência: Livro-texto, Seção 6.3.3, "Gaussian White Noise in Receivers".
     """
     # Calcula a potência média do sinal de entrada (variância para sinais de média zero).
-    mean_square = np.mean(np.abs(input_seq)**2)
+    # `squared_magnitude` evita a raiz quadrada de `np.abs` e fica na precisão da entrada.
+    mean_square = np.mean(squared_magnitude(input_seq))
     # Calcula a potência de ruído necessária para atingir a SNR alvo.
     noise_power = mean_square / (10**(snr / 10))
     std_noise = np.sqrt(noise_power)
 
     # Gera ruído complexo com componentes real e imaginário independentes e
     # com distribuição Gaussiana. O fator 0.70711 (1/sqrt(2)) normaliza a potência.
-    noise = std_noise * (0.70711 * np.random.randn(len(input_seq)) +
-                         1j * 0.70711 * np.random.randn(len(input_seq)))
+    # Uma única chamada sorteia as partes real (linha 0) e imaginária (linha 1)
+    # na mesma ordem das duas chamadas a `randn` do código original, mantendo
+    # reprodutíveis as simulações que usam `np.random.seed`. O vetor complexo é
+    # montado e escalado no próprio buffer de saída, sem temporários.
+    draws = np.random.randn(2, len(input_seq))
+    noise = np.empty(len(input_seq), dtype=np.result_type(input_seq.dtype, np.complex64))
+    noise.real = draws[0]
+    noise.imag = draws[1]
+    noise *= std_noise * 0.70711
     return noise
 
 def get_multipath_filter(sample_rate, delay_spread, n):
@@ -166,11 +311,11 @@ def get_multipath_filter(sample_rate, delay_spread, n):
     exp_variance = np.exp(-n_range * ts / trms)
 
     # Gera os coeficientes do filtro FIR como variáveis aleatórias complexas Gaussianas
-    # com a variância calculada.
-    fir_taps = np.zeros(n, dtype=complex)
-    for i in range(n):
-        fir_taps[i] = (np.sqrt(exp_variance[i]) * np.random.randn() +
-                       1j * np.sqrt(exp_variance[i]) * np.random.randn())
+    # com a variância calculada. Sortear uma matriz (n, 2) de uma vez consome o
+    # gerador na mesma ordem do laço original (real, imaginário, tap a tap).
+    sigma = np.sqrt(exp_variance)
+    draws = np.random.randn(n, 2)
+    fir_taps = sigma * draws[:, 0] + 1j * sigma * draws[:, 1]
     return fir_taps
 
 def iq_imbalance(tx_samples, phase_imbalance, i_gain, q_gain):
@@ -187,17 +332,23 @@ def iq_imbalance(tx_samples, phase_imbalance, i_gain, q_gain):
     O modelo implementado é:
     s_out(t) = g_i * i(t) + j * g_q * ( q(t) * cos(phi) + i(t) * sin(phi) )
     """
+    # As componentes I e Q são tratadas como dois vetores reais (views de
+    # `.real` e `.imag`, sem cópia), e a saída é escrita diretamente nas partes
+    # real e imaginária do vetor complexo de retorno, sem temporários complexos.
+    # A saída mantém a precisão da entrada (complex64 na cascata do canal).
     i_in = np.real(tx_samples)
     q_in = np.imag(tx_samples)
+    output = np.empty(len(tx_samples), dtype=np.result_type(tx_samples.dtype, np.complex64))
 
-    # Simula o erro de fase (cross-talk do componente I para o Q).
-    q_phase_imbalanced = q_in * np.cos(phase_imbalance) + i_in * np.sin(phase_imbalance)
+    # Aplica o ganho de amplitude em I.
+    np.multiply(i_in, i_gain, out=output.real)
 
-    # Aplica os ganhos de amplitude.
-    i_out = i_gain * i_in
-    q_out = q_gain * q_phase_imbalanced
+    # Simula o erro de fase (cross-talk do componente I para o Q) e aplica o
+    # ganho de Q, com os dois fatores escalares combinados antecipadamente.
+    np.multiply(q_in, q_gain * np.cos(phase_imbalance), out=output.imag)
+    output.imag += (q_gain * np.sin(phase_imbalance)) * i_in
 
-    return i_out + 1j * q_out
+    return output
 
 def phase_noise_generator(sample_rate, number_of_samples, dbc, freq):
     """
@@ -217,6 +368,67 @@ def phase_noise_generator(sample_rate, number_of_samples, dbc, freq):
 
     Referência: livro-texto, Seção 6.3.4 e Figura 6-38.
     """
+    # O projeto do FIR depende apenas do perfil, constante ao longo de uma
+    # simulação; por isso é feito uma única vez e reaproveitado entre quadros.
+    fir_taps, rms_pe = _design_phase_noise_filter(tuple(dbc), tuple(freq))
+    n_fft = len(fir_taps)
+
+    # Filtra ruído branco gerado a 4 MS/s para produzir ruído colorido. A taxa
+    # interna menor reduz custo, e a interpolação abaixo leva o ruído para a
+    # taxa de amostragem do sinal simulado.
+    sample_ratio = sample_rate / 4e6
+    samples_at_4mhz = int(np.ceil(number_of_samples / sample_ratio))
+    wgn = np.random.randn(n_fft + samples_at_4mhz)
+
+    filter_output = lfilter(fir_taps, [1], wgn)
+    # Descarta o transiente inicial do filtro.
+    out_4mhz = filter_output[n_fft//2 -1 : n_fft//2 -1 + samples_at_4mhz]
+
+    # Interpola para a taxa final. `sample_ratio` é racional com denominador
+    # pequeno (40 MS/s -> 10/1), então um filtro polifásico substitui o spline
+    # cúbico: `output_interp[m]` corresponde ao instante `m / sample_ratio` da
+    # grade de 4 MS/s, como na interpolação original.
+    ratio = Fraction(sample_ratio).limit_denominator(1000)
+    up, down = ratio.numerator, ratio.denominator
+    if up == down:
+        output_interp = out_4mhz
+    else:
+        output_interp = resample_poly(out_4mhz, up, down, window=_resampling_filter(up, down))
+
+    # Preenche o restante do buffer, se a interpolação não gerar amostras suficientes.
+    if len(output_interp) < number_of_samples:
+        padding = np.zeros(number_of_samples - len(output_interp))
+        output = np.concatenate((output_interp, padding))
+    else:
+        output = output_interp[:number_of_samples]
+
+    # Normaliza a variância para corresponder ao erro de fase RMS calculado.
+    # Sem esta etapa, o formato espectral estaria correto, mas a intensidade
+    # absoluta dependeria do ganho numérico do filtro e do tamanho da FFT.
+    out_temp = output[:number_of_samples]
+    rms_output = np.sqrt(np.var(out_temp))
+
+    # Evita divisão por zero se a saída for nula.
+    if rms_output == 0:
+        rms_output = 1e-9
+
+    out = out_temp * rms_pe / rms_output
+
+    return out, rms_pe
+
+@lru_cache(maxsize=16)
+def _design_phase_noise_filter(dbc, freq):
+    """
+    Etapas 1 a 3 de `phase_noise_generator`: a partir do perfil de ruído de
+    fase (tuplas `dbc` e `freq`), calcula o erro de fase RMS e projeta o FIR,
+    a 4 MS/s, que dá ao ruído branco o formato espectral desejado.
+
+    Returns:
+        Tupla `(fir_taps, rms_pe)`.
+    """
+    dbc = np.asarray(dbc)
+    freq = np.asarray(freq)
+
     # Perfis de ruído de fase costumam ser especificados em poucos offsets de
     # frequência. Os pontos artificiais em -200 dBc/Hz servem como piso numérico
     # e estabilizam a interpolação fora da faixa informada.
@@ -256,45 +468,6 @@ def phase_noise_generator(sample_rate, number_of_samples, dbc, freq):
     h1 = h[1:n_fft+1]
     fir_taps *= h1
 
-    # Filtra ruído branco gerado a 4 MS/s para produzir ruído colorido. A taxa
-    # interna menor reduz custo, e a interpolação abaixo leva o ruído para a
-    # taxa de amostragem do sinal simulado.
-    sample_ratio = sample_rate / 4e6
-    samples_at_4mhz = int(np.ceil(number_of_samples / sample_ratio))
-    wgn = np.random.randn(n_fft + samples_at_4mhz)
-
-    filter_output = lfilter(fir_taps, [1], wgn)
-    # Descarta o transiente inicial do filtro.
-    out_4mhz = filter_output[n_fft//2 -1 : n_fft//2 -1 + samples_at_4mhz]
-
-    # Interpola para a taxa final.
-    sample_time_4mhz = np.arange(1, len(out_4mhz) + 1)
-    new_sample_time = np.arange(1, number_of_samples + 1) / sample_ratio
-
-    # Garante que os pontos de consulta estejam dentro do intervalo válido.
-    new_sample_time = new_sample_time[new_sample_time <= sample_time_4mhz[-1]]
-    new_sample_time = new_sample_time[new_sample_time >= sample_time_4mhz[0]]
-
-    cs = CubicSpline(sample_time_4mhz, out_4mhz)
-    output_interp = cs(new_sample_time)
-
-    # Preenche o restante do buffer, se a interpolação não gerar amostras suficientes.
-    if len(output_interp) < number_of_samples:
-        padding = np.zeros(number_of_samples - len(output_interp))
-        output = np.concatenate((output_interp, padding))
-    else:
-        output = output_interp[:number_of_samples]
-
-    # Normaliza a variância para corresponder ao erro de fase RMS calculado.
-    # Sem esta etapa, o formato espectral estaria correto, mas a intensidade
-    # absoluta dependeria do ganho numérico do filtro e do tamanho da FFT.
-    out_temp = output[:number_of_samples]
-    rms_output = np.sqrt(np.var(out_temp))
-
-    # Evita divisão por zero se a saída for nula.
-    if rms_output == 0:
-        rms_output = 1e-9
-
-    out = out_temp * rms_pe / rms_output
-
-    return out, rms_pe
+    # O resultado é compartilhado pelo cache; protege-o contra escrita.
+    fir_taps.flags.writeable = False
+    return fir_taps, rms_pe
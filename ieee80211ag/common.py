@@ -3,27 +3,48 @@
 # =============================================================================
 
 import numpy as np
+from functools import lru_cache
 
 # LUTs de constelação em ordem Gray, com normalização de potência média para 1
 # conforme IEEE 802.11a, Seção 17.3.5.7 e Tabela 81. O gr-ieee802-11 define
 # os mesmos fatores em `lib/constellations_impl.cc`.
+#
+# Os níveis de cada eixo são guardados como inteiros (`*_LEVELS`), e o fator de
+# normalização K_MOD (`K_*`) fica separado, para que o mapeamento trabalhe com
+# inteiros e aplique a escala uma única vez. As `*_LUT` já normalizadas
+# (`*_LEVELS * K_*`) continuam disponíveis, e.g. para o demapper. Todas as
+# tabelas são somente leitura.
 
 # BPSK: 1 bit por símbolo.
-BPSK_LUT = np.array([-1, 1])
+BPSK_LEVELS = np.array([-1, 1], dtype=np.int8)
+K_BPSK = 1.0
+BPSK_LUT = BPSK_LEVELS * K_BPSK
 
 # QPSK: 1 bit por eixo, normalizado por sqrt(2).
-QPSK_LUT = np.array([-1, 1]) / np.sqrt(2)
+QPSK_LEVELS = np.array([-1, 1], dtype=np.int8)
+K_QPSK = 1 / np.sqrt(2)
+QPSK_LUT = QPSK_LEVELS * K_QPSK
 
 # 16-QAM: níveis {-3, -1, 1, 3}; E[I^2 + Q^2] = 10.
-QAM16_LUT = np.array([-3, -1, 1, 3]) / np.sqrt(10)
+QAM16_LEVELS = np.array([-3, -1, 1, 3], dtype=np.int8)
+K_QAM16 = 1 / np.sqrt(10)
+QAM16_LUT = QAM16_LEVELS * K_QAM16
 
 # 64-QAM: níveis {-7, -5, -3, -1, 1, 3, 5, 7}; E[I^2 + Q^2] = 42.
-QAM64_LUT = np.array([-7, -5, -3, -1, 1, 3, 5, 7]) / np.sqrt(42)
+QAM64_LEVELS = np.array([-7, -5, -3, -1, 1, 3, 5, 7], dtype=np.int8)
+K_QAM64 = 1 / np.sqrt(42)
+QAM64_LUT = QAM64_LEVELS * K_QAM64
+
+for _table in (BPSK_LEVELS, BPSK_LUT, QPSK_LEVELS, QPSK_LUT,
+               QAM16_LEVELS, QAM16_LUT, QAM64_LEVELS, QAM64_LUT):
+    _table.setflags(write=False)
+del _table
 
 # Sequência de polaridade dos pilotos conforme IEEE 802.11a (Seção 17.3.5.9)
 # Esta sequência de 127 elementos evita linhas espectrais nos pilotos. O elemento
 # p_0 é usado no SIGNAL; p_1 em diante, nos símbolos DATA. O gr-ieee802-11
 # define a mesma tabela em `lib/equalizer/base.cc` como `POLARITY`.
+# Guardada em int8: os 127 sinais ocupam duas linhas de cache em vez de dezesseis.
 PILOT_POLARITY = np.array([
     1, 1, 1, 1, -1, -1, -1, 1, -1, -1, -1, -1, 1, 1, -1, 1,
    -1, -1, 1, 1, -1, 1, 1, -1, 1, 1, 1, 1, 1, 1, -1, 1,
@@ -33,20 +54,32 @@ PILOT_POLARITY = np.array([
    -1, 1, -1, -1, 1, -1, 1, 1, 1, 1, -1, 1, -1, 1, -1, 1,
    -1, -1, -1, -1, -1, 1, -1, 1, 1, -1, 1, -1, 1, 1, 1, -1,
    -1, 1, -1, -1, -1, 1, 1, 1, -1, -1, -1, -1, -1, -1, -1
-])
+], dtype=np.int8)
+PILOT_POLARITY.setflags(write=False)
 
 # Índices dos pilotos na numeração relativa ao DC (-26 a +26).
 # Referência: IEEE 802.11a, Seção 17.3.5.8; livro-texto, Figura 7-15.
 PILOT_CARRIERS = np.array([-21, -7, 7, 21])
+PILOT_CARRIERS.setflags(write=False)
 
 # Índices das subportadoras piloto no vetor de entrada da IFFT de 64 pontos.
 # Para k < 0, o índice FFT é 64 + k. Na ordem fftshift usada por
 # `lib/frame_equalizer_impl.cc`, esses pilotos aparecem em 11, 25, 39 e 53.
-PILOT_CARRIERS_IDX = np.array([64-21, 64-7, 7, 21])
+# As tabelas de índices usam `np.intp`, o tipo que o NumPy exige em indexação
+# avançada, para que nenhuma conversão ocorra a cada acesso.
+PILOT_CARRIERS_IDX = np.array([64-21, 64-7, 7, 21], dtype=np.intp)
+PILOT_CARRIERS_IDX.setflags(write=False)
 
 # Polaridade base dos quatro pilotos antes da modulação pela sequência pseudoaleatória.
 # Ordem: subportadoras -21, -7, 7 e 21. A polaridade final também inclui p_n.
-PILOT_BASE_POLARITY = np.array([1, 1, 1, -1])
+PILOT_BASE_POLARITY = np.array([1, 1, 1, -1], dtype=np.int8)
+PILOT_BASE_POLARITY.setflags(write=False)
+
+# Valores esperados dos quatro pilotos para cada posição da sequência de
+# polaridade: `PILOT_REF[n % 127]` equivale a
+# `PILOT_BASE_POLARITY * PILOT_POLARITY[n % 127]`, na ordem de `PILOT_CARRIERS`.
+PILOT_REF = np.multiply.outer(PILOT_POLARITY, PILOT_BASE_POLARITY).astype(np.complex64)
+PILOT_REF.setflags(write=False)
 
 # Índices das 48 subportadoras de dados no vetor de entrada da IFFT de 64 pontos.
 # A norma usa 52 tons ativos: 48 de dados e 4 pilotos. A lista abaixo contém
@@ -58,7 +91,8 @@ DATA_CARRIERS_IDX = np.array([
     # Mapeamento para subportadoras positivas (1 a 26, excluindo 7, 21)
     # Índice FFT = k_subportadora
     1, 2, 3, 4, 5, 6, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 22, 23, 24, 25, 26
-])
+], dtype=np.intp)
+DATA_CARRIERS_IDX.setflags(write=False)
 
 # Tabela de mapeamento para as taxas de dados definidas na norma IEEE 802.11a.
 # Cada taxa define a modulação (N_BPSC), taxa de código, bits codificados (N_CBPS)
@@ -75,6 +109,72 @@ RATE_MAP = {
     0b0011: {'name': '64-QAM 3/4','Mbps': 54, 'n_bpsc': 6, 'n_dbps': 216, 'n_cbps': 288},
 }
 
+# Os mesmos parâmetros como tabelas indexadas diretamente pelo campo RATE de
+# 4 bits. Códigos inválidos ficam com zero e `RATE_VALID` falso.
+N_BPSC = np.zeros(16, dtype=np.intp)
+N_DBPS = np.zeros(16, dtype=np.intp)
+N_CBPS = np.zeros(16, dtype=np.intp)
+RATE_VALID = np.zeros(16, dtype=bool)
+for _rate, _info in RATE_MAP.items():
+    N_BPSC[_rate] = _info['n_bpsc']
+    N_DBPS[_rate] = _info['n_dbps']
+    N_CBPS[_rate] = _info['n_cbps']
+    RATE_VALID[_rate] = True
+del _rate, _info
+for _table in (N_BPSC, N_DBPS, N_CBPS, RATE_VALID):
+    _table.setflags(write=False)
+del _table
+
+def squared_magnitude(x):
+    """
+    Calcula `|x|^2` como `x.real**2 + x.imag**2`. Equivale a `np.abs(x)**2`,
+    mas evita a raiz quadrada que `np.abs` calcula só para ser desfeita.
+    """
+    return x.real * x.real + x.imag * x.imag
+
+def nco_signal(frequency, sample_rate, number_of_samples, first_index=0, block_size=1024):
+    """
+    Gera `exp(1j*2*pi*frequency*n/sample_rate)` para `n = first_index, ...,
+    first_index + number_of_samples - 1`, como um oscilador controlado
+    numericamente (NCO).
+
+    Em vez de avaliar a exponencial complexa em cada amostra, o sinal é montado
+    em blocos: um bloco-base de `block_size` amostras é multiplicado pela fase
+    inicial de cada bloco. Isso troca N exponenciais por cerca de
+    `block_size + N/block_size` exponenciais e N multiplicações. Como a fase de
+    cada bloco é calculada diretamente, e não acumulada, o erro numérico não
+    cresce ao longo do sinal, ao contrário de um rotador puramente recursivo.
+    """
+    omega = 2 * np.pi * frequency / sample_rate
+    number_of_blocks = -(-number_of_samples // block_size)
+    base = np.exp(1j * omega * np.arange(block_size))
+    block_phase = np.exp(1j * omega * (first_index + block_size * np.arange(number_of_blocks)))
+    return np.outer(block_phase, base).ravel()[:number_of_samples]
+
+def _training_idft(tones, step, num_samples):
+    """
+    Calcula `x[n] = sum_m tones[m] * exp(1j*2*pi*n*step*m/64)` para
+    `n = 0, ..., num_samples - 1`, com os 64 tons na ordem m = -32, ..., 31.
+
+    `step` mapeia o índice da amostra para um "tempo" normalizado: `step=1`
+    gera a 20 MS/s e `step=0.5`, a 40 MS/s. Quando `1/step` é inteiro, a soma
+    é exatamente uma IFFT de `64/step` pontos com os tons em zero-padding,
+    repetida periodicamente até `num_samples`. Outros valores de `step` usam a
+    IDFT manual, como um único produto matriz-vetor.
+    """
+    N = 64  # A norma especifica uma IFFT de 64 pontos.
+    m = np.arange(-32, 32)
+    upsampling = 1 / step
+    if upsampling == int(upsampling):
+        nfft = N * int(upsampling)
+        spectrum = np.zeros(nfft, dtype=complex)
+        spectrum[m % nfft] = tones
+        return np.resize(nfft * np.fft.ifft(spectrum), num_samples)
+
+    phase = (2 * np.pi * step / N) * np.outer(np.arange(num_samples), m)
+    return np.exp(1j * phase) @ tones
+
+@lru_cache(maxsize=8)
 def get_short_training_sequence(step):
     """
     Gera a forma de onda no domínio do tempo para a Sequência de Treinamento Curta (STS).
@@ -84,33 +184,32 @@ def get_short_training_sequence(step):
     Essa periodicidade alimenta a detecção de pacote, AGC e estimativa grosseira
     de frequência.
 
+    O resultado depende apenas de `step` e fica em cache. O vetor devolvido é
+    somente leitura, pois é compartilhado entre todas as chamadas.
+
     Referências: livro-texto, Seção 7.2.3; IEEE 802.11a, Seção 17.3.3 e Tabela G.2.
     """
-    # Valores complexos das 12 subportadoras ativas da STS.
-    positive = np.array([0,0,0,0, -1-1j, 0,0,0, -1-1j, 0,0,0,  1+1j, 0,0,0,
-                         1+1j, 0,0,0,  1+1j, 0,0,0,  1+1j, 0,0,0, 0,0,0,0])
-    negative = np.array([0,0,0,0, 0,0,0,0,  1+1j, 0,0,0, -1-1j, 0,0,0,
-                         1+1j, 0,0,0, -1-1j, 0,0,0, -1-1j, 0,0,0,  1+1j, 0,0,0])
+    # A STS tem apenas 12 subportadoras ativas, em múltiplos de 4 do índice
+    # k = -26, ..., 26, cada uma valendo 1+j ou -1-j. O vetor de 64 tons segue
+    # a ordem k = -32, ..., 31, portanto a posição de k é k + 32.
+    k_plus = np.array([-24, -16, -4, 12, 16, 20, 24])
+    k_minus = np.array([-20, -12, -8, 4, 8])
 
     # O fator de escala sqrt(13/6) normaliza a potência média do símbolo resultante.
     # A norma o especifica para garantir que a potência da STS seja consistente com
     # o resto do pacote.
-    total = np.sqrt(13/6) * np.concatenate((negative, positive))
-    m = np.arange(-32, 32)
+    total = np.zeros(64, dtype=complex)
+    total[k_plus + 32] = np.sqrt(13/6) * (1 + 1j)
+    total[k_minus + 32] = np.sqrt(13/6) * (-1 - 1j)
 
-    N = 64  # A norma especifica uma IFFT de 64 pontos.
     # A STS completa tem 10 repetições de 16 amostras a 20 MS/s.
     num_samples = int(160 / step)
-    short_training_sequence = np.zeros(num_samples, dtype=complex)
-
-    # IDFT manual para permitir `step=0.5` na geração a 40 MS/s.
-    for n in range(num_samples):
-        t = n * step # Mapeia o índice da amostra para um "tempo" normalizado
-        E = np.exp(1j * 2 * np.pi * t * m / N)
-        short_training_sequence[n] = np.dot(total, E.T)
+    short_training_sequence = _training_idft(total, step, num_samples)
 
+    short_training_sequence.setflags(write=False)
     return short_training_sequence
 
+@lru_cache(maxsize=8)
 def get_long_training_sequence(step):
     """
     Gera a sequência de treinamento longa (Long Training Sequence - LTS) do preâmbulo 802.11a.
@@ -119,27 +218,22 @@ def get_long_training_sequence(step):
     sincronização fina de frequência. A sequência no domínio da frequência
     corresponde ao vetor `LONG` de `lib/equalizer/base.cc` no gr-ieee802-11.
 
+    Assim como na STS, o resultado fica em cache e os vetores devolvidos são
+    somente leitura.
+
     Referências: livro-texto, Seção 7.2.3; IEEE 802.11a, Seção 17.3.3.
     """
-    # Valores BPSK das subportadoras da LTS no domínio da frequência.
-    positive = np.array([0, 1,-1,-1, 1, 1,-1, 1, -1, 1,-1,-1, -1,-1,-1, 1,
-                         1,-1,-1, 1, -1, 1,-1, 1,  1, 1, 1, 0,  0, 0, 0, 0])
-    negative = np.array([0, 0, 0, 0, 0, 0, 1, 1, -1,-1, 1, 1, -1, 1,-1, 1,
-                         1, 1, 1, 1, 1,-1,-1, 1,  1,-1, 1,-1,  1, 1, 1, 1])
-
-    # Ordem de frequência: tons negativos seguidos dos positivos.
-    all_tones = np.concatenate((negative, positive))
-    m = np.arange(-32, 32)
+    # Valores BPSK das subportadoras da LTS para k = -26, ..., 26, com DC nulo.
+    L = np.array([1, 1,-1,-1, 1, 1,-1, 1,-1, 1, 1, 1, 1, 1, 1,-1,-1, 1, 1,-1, 1,-1, 1, 1, 1, 1,
+                  0,
+                  1,-1,-1, 1, 1,-1, 1,-1, 1,-1,-1,-1,-1,-1, 1, 1,-1,-1, 1,-1, 1,-1, 1, 1, 1, 1])
 
-    N = 64 # Tamanho da IFFT
-    num_samples = int(64 / step) # O número de amostras depende da taxa (step=1 para 20MHz, 0.5 para 40MHz)
-    long_training_symbol = np.zeros(num_samples, dtype=complex)
+    # Ordem de frequência k = -32, ..., 31: os tons de guarda ficam nulos.
+    all_tones = np.zeros(64, dtype=int)
+    all_tones[-26 + 32:26 + 33] = L
 
-    # IDFT manual para permitir `step=0.5` na geração a 40 MS/s.
-    for n in range(num_samples):
-        t = n * step # Mapeia o índice da amostra para um "tempo" normalizado
-        E = np.exp(1j * 2 * np.pi * t * m / N)
-        long_training_symbol[n] = np.dot(all_tones, E.T)
+    num_samples = int(64 / step) # O número de amostras depende da taxa (step=1 para 20MHz, 0.5 para 40MHz)
+    long_training_symbol = _training_idft(all_tones, step, num_samples)
 
     # LTS completa: GI2 seguido por duas repetições do símbolo longo.
     if step == 1: # Caso de 20 MS/s (64 amostras por símbolo)
@@ -153,9 +247,31 @@ def get_long_training_sequence(step):
                                                  long_training_symbol,
                                                  long_training_symbol))
 
+    long_training_sequence.setflags(write=False)
+    all_tones.setflags(write=False)
     return long_training_sequence, all_tones
 
-def scramble(data_bits, initial_state=0b1011101):
+@lru_cache(maxsize=128)
+def _scrambler_keystream(initial_state):
+    """
+    Gera um período (127 bits) da sequência do scrambler para `initial_state`.
+    A sequência não depende dos dados, então pode ser calculada uma única vez
+    por estado inicial. O vetor devolvido é somente leitura.
+    """
+    keystream = np.empty(127, dtype=np.uint8)
+    # O estado inicial deve ser não nulo. O registrador fica num único inteiro
+    # de 7 bits, na ordem de `format(initial_state, '07b')`: o primeiro bit da
+    # string é o bit 6 e o último é o bit 0.
+    state = initial_state & 0x7F
+    for i in range(127):
+        # Feedback do polinômio x^7 + x^4 + 1.
+        feedback = (state ^ (state >> 3)) & 1
+        keystream[i] = feedback
+        state = (state >> 1) | (feedback << 6)
+    keystream.setflags(write=False)
+    return keystream
+
+def scramble(data_bits, initial_state=0b1011101, out=None):
     """
     Embaralha os dados de entrada usando uma sequência pseudoaleatória.
 
@@ -163,16 +279,19 @@ def scramble(data_bits, initial_state=0b1011101):
     concentração espectral. A norma especifica o registrador de 7 bits com
     polinômio S(x) = x^7 + x^4 + 1.
 
+    Como o registrador tem período 127 e não depende dos dados, um período da
+    sequência é gerado por `_scrambler_keystream` e repetido até o tamanho da
+    entrada; o embaralhamento é então um único XOR vetorizado.
+
+    Se `out` for fornecido (com o mesmo tamanho e dtype de `data_bits`, podendo
+    ser o próprio `data_bits`), o resultado é escrito nele, sem alocar a saída;
+    isso permite reaproveitar um buffer em simulações com muitos quadros.
+
     Referências: livro-texto, Seção 5.6; IEEE 802.11a, Seção 17.3.5.4;
     gr-ieee802-11, `lib/utils.cc`, função `scramble`.
     """
-    scrambled = np.zeros_like(data_bits)
-    # O estado inicial deve ser não nulo.
-    state = np.array([int(b) for b in format(initial_state, '07b')], dtype=int)
-    for i in range(len(data_bits)):
-        # Feedback do polinômio x^7 + x^4 + 1.
-        feedback = state[6] ^ state[3]
-        scrambled[i] = data_bits[i] ^ feedback
-        state[1:] = state[:-1]
-        state[0] = feedback
-    return scrambled
+    data_bits = np.asarray(data_bits)
+    keystream = np.resize(_scrambler_keystream(int(initial_state)), len(data_bits))
+    if out is None:
+        return np.bitwise_xor(data_bits, keystream).astype(data_bits.dtype, copy=False)
+    return np.bitwise_xor(data_bits, keystream, out=out)
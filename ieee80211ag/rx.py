@@ -4,12 +4,33 @@
 
 import numpy as np
 import binascii
+import cmath
 import logging
 
 from .bcc import decode_soft
 from .common import *
 
-_DEINTERLEAVING_PATTERNS = {} # Cache para os padrões
+_DEINTERLEAVING_PATTERNS = {} # Cache para os padrões, indexado por (n_cbps, n_bpsc) como ints
+
+# Tons conhecidos da LTS na ordem natural da FFT, usados como divisor na
+# estimativa de canal. A LTS tem tons nulos em DC e nas bandas de guarda. Eles
+# não participam da equalização de dados, mas entram no vetor de 64 posições;
+# usar um epsilon evita warning de divisão por zero sem afetar os tons de
+# dados/pilotos. O vetor é constante, então é montado uma única vez.
+_LTS_TONES_FFT_ORDER = np.fft.fftshift(get_long_training_sequence(1)[1]).astype(float)
+_LTS_TONES_FFT_ORDER[_LTS_TONES_FFT_ORDER == 0] = 1e-9
+_LTS_TONES_FFT_ORDER.setflags(write=False)
+
+# Pesos dos bits dos campos RATE (R1 mais significativo) e LENGTH (LSB
+# primeiro) do SIGNAL, para converter bits em inteiro com um produto escalar.
+_RATE_BIT_WEIGHTS = 1 << np.arange(3, -1, -1)
+_LENGTH_BIT_WEIGHTS = 1 << np.arange(12)
+for _table in (_RATE_BIT_WEIGHTS, _LENGTH_BIT_WEIGHTS):
+    _table.setflags(write=False)
+del _table
+
+# CRC-32 de qualquer mensagem seguida do seu próprio CRC-32 em little-endian.
+_CRC32_RESIDUE = 0x2144DF1C
 
 def packet_detector(rx_input):
     """
@@ -40,19 +61,23 @@ def packet_detector(rx_input):
     comparison_ratio = np.zeros(len(rx_input))
     packet_det_flag = np.zeros(len(rx_input))
 
-    # Buffers que atuam como registradores de deslocamento para os filtros de média móvel
+    # Buffers circulares para o atraso e para os filtros de média móvel. Em vez
+    # de deslocar o buffer inteiro a cada amostra, a posição `i % tamanho`
+    # guarda a amostra mais antiga, que é lida e sobrescrita pela nova. Como os
+    # tamanhos são potências de 2, o índice pode ser `i & 15` ou `i & 31`.
     delay16 = np.zeros(16, dtype=complex)  # Armazena as últimas 16 amostras para o atraso da autocorrelação
     sliding_average1 = np.zeros(32, dtype=complex) # Buffer para a média da autocorrelação
     sliding_average2 = np.zeros(32, dtype=float)   # Buffer para a média da potência (variância)
     falling_edge_position = -1 # Posição da borda de descida, nossa referência de tempo grosseira. -1 = não encontrado.
 
     for i in range(len(rx_input)):
-        rx_input_16 = delay16[15]
-        delay16[1:] = delay16[:15]
-        delay16[0] = rx_input[i]
+        rx_input_16 = delay16[i & 15]  # Amostra de 16 instantes atrás (0 no início)
+        delay16[i & 15] = rx_input[i]
 
         # TAREFA DO ALUNO: calcule a autocorrelação instantânea, atualize a
-        # média móvel de autocorrelação e armazene `auto_corr_est[i]`.
+        # média móvel de autocorrelação e armazene `auto_corr_est[i]`. Com o
+        # buffer circular, a soma da janela pode ser mantida em uma variável:
+        # some o valor que entra e subtraia o que sai de `sliding_average1[i & 31]`.
 
         # TAREFA DO ALUNO: calcule a potência instantânea, atualize a média móvel
         # de potência e use-a para normalizar `comparison_ratio[i]`.
@@ -95,7 +120,8 @@ def detect_frequency_offsets(rx_input, falling_edge_position):
     delay16 = np.zeros(16, dtype=complex)
     sliding_average1 = np.zeros(32, dtype=complex)
 
-    # TAREFA DO ALUNO: calcule a autocorrelação com atraso 16, meça a fase em
+    # TAREFA DO ALUNO: calcule a autocorrelação com atraso 16 (os buffers podem
+    # ser usados como circulares, como em `packet_detector`), meça a fase em
     # uma posição estável da STS e converta essa fase para Hertz. Uma escolha
     # robusta é medir cerca de 50 amostras antes de `falling_edge_position`, onde
     # a autocorrelação ainda está no platô da sequência curta. Verifique os
@@ -196,27 +222,26 @@ def ofdm_receiver(rx_waveform_20mhz, sample_advance, correct_frequency_offset,
         logging.info(f"Error in Falling Edge Position: {falling_edge_position}")
         return np.array([])
 
-    # 2. Corrige o deslocamento de frequência grosseiro medido na STS.
+    # 2. Estima o deslocamento de frequência grosseiro na STS.
     freq_offset = detect_frequency_offsets(rx_waveform_20mhz, falling_edge_position)
     coarse_offset = freq_offset[0]
     if correct_frequency_offset == 1:
-        n = np.arange(len(rx_waveform_20mhz))
-
-        # Mistura digital por -coarse_offset para cancelar a rotação medida.
+        # 3. Repete a estimativa na LTS, já corrigida pelo deslocamento
+        # grosseiro, para obter a correção fina. A estimativa fina só usa o
+        # preâmbulo; por isso a mistura grosseira é aplicada a uma cópia que
+        # cobre a LTS com folga, e não ao pacote inteiro.
+        preamble_length = min(len(rx_waveform_20mhz), falling_edge_position + 256)
+        preamble = rx_waveform_20mhz[:preamble_length] * nco_signal(-coarse_offset, 20e6, preamble_length)
+        fine_offset = detect_frequency_offsets(preamble, falling_edge_position)[1]
+
+        # Mistura digital por -(coarse_offset + fine_offset) para cancelar a
+        # rotação medida. Como exp(-j*w1*n) * exp(-j*w2*n) = exp(-j*(w1+w2)*n),
+        # as duas correções são aplicadas em uma única passada.
         # O `gr-ieee802-11` aplica a etapa análoga em `lib/sync_short.cc`.
-        nco_signal = np.exp(-1j * 2 * np.pi * n * coarse_offset / 20e6)
-        rx_waveform_20mhz *= nco_signal
-
-    # 3. Repete a estimativa na LTS para a correção fina.
-    freq_offset = detect_frequency_offsets(rx_waveform_20mhz, falling_edge_position)
-    fine_offset = freq_offset[1]
-    if correct_frequency_offset == 1:
-        n = np.arange(len(rx_waveform_20mhz))
-        nco_signal = np.exp(-1j * 2 * np.pi * n * fine_offset / 20e6)
-        rx_waveform_20mhz *= nco_signal
+        rx_waveform_20mhz *= nco_signal(-(coarse_offset + fine_offset), 20e6, len(rx_waveform_20mhz))
 
     # 4. Sincronização fina de tempo pela correlação com a LTS local.
-    long_training_sequence, all_tones = get_long_training_sequence(1)
+    long_training_sequence, _ = get_long_training_sequence(1)
 
     # Usa um único símbolo longo como molde do correlacionador.
     long_training_symbol = long_training_sequence[32:96]
@@ -237,18 +262,14 @@ def ofdm_receiver(rx_waveform_20mhz, sample_advance, correct_frequency_offset,
     averaged_long_training_symbol = first_long_symbol * 0.5 + second_long_symbol * 0.5
 
     fft_of_long_training_symbol = (1/64) * np.fft.fft(averaged_long_training_symbol)
-    all_tones_fft_order = np.array(np.fft.fftshift(all_tones), dtype=float)
-
-    # A LTS tem tons nulos em DC e nas bandas de guarda. Eles não participam da
-    # equalização de dados, mas entram no vetor de 64 posições; usar um epsilon
-    # evita warning de divisão por zero sem afetar os tons de dados/pilotos.
-    all_tones_fft_order[all_tones_fft_order == 0] = 1e-9
 
     # Nos tons conhecidos da LTS, H ~= Y/X. O equalizador zero-forcing usa 1/H.
     # Referências: livro-texto, Seções 7.1.3.5 e 7.3.5; gr-ieee802-11,
     # `lib/equalizer/ls.cc`.
-    channel_estimate = fft_of_long_training_symbol / all_tones_fft_order
-    equalizer_coefficients = 1 / channel_estimate
+    channel_estimate = fft_of_long_training_symbol / _LTS_TONES_FFT_ORDER
+    # 1/H = conj(H)/|H|^2: um conjugado e uma divisão real por subportadora, em
+    # vez de uma divisão complexa completa.
+    equalizer_coefficients = np.conj(channel_estimate) / squared_magnitude(channel_estimate)
 
     # 6. Calcula pesos para combinar os pilotos na estimativa de fase.
     pilot_strength = np.abs(channel_estimate[PILOT_CARRIERS_IDX])
@@ -275,25 +296,46 @@ def ofdm_receiver(rx_waveform_20mhz, sample_advance, correct_frequency_offset,
     # de piloto desloque todos os coeficientes de uma vez.
     L = 8
     average_slope_filter = np.zeros(L)
-    corrected_symbols = np.zeros(48 * number_of_ofdm_symbols, dtype=complex)
+    slope_sum = 0.0
+
+    # Índice de cada subportadora (-32 a 31) na ordem natural da FFT.
+    k = np.fft.fftshift(np.arange(-32, 32))
+
+    # Os símbolos ocupam blocos consecutivos de 80 amostras (GI de 16 + 64)
+    # logo após a LTS. Processa apenas os que cabem inteiros no sinal recebido.
+    first_symbol_start = lt_peak_position + 64 + 16
+    available_symbols = max(0, (len(rx_waveform_20mhz) - first_symbol_start - 64) // 80 + 1)
+    if available_symbols < number_of_ofdm_symbols:
+        logging.info(f"Símbolo {available_symbols+1} fora dos limites. Interrompendo o processamento.")
+        number_of_ofdm_symbols = available_symbols
+    if number_of_ofdm_symbols == 0:
+        return np.zeros(0, dtype=complex)
+
+    # A FFT não depende do rastreamento de fase, então todos os símbolos são
+    # transformados em uma única chamada. Cada linha da matriz é uma visão da
+    # janela de 64 amostras de um símbolo, sem o GI; o último símbolo não
+    # precisa ter as 16 amostras seguintes.
+    windows = np.lib.stride_tricks.sliding_window_view(rx_waveform_20mhz[first_symbol_start:], 64)
+    ofdm_symbols = windows[::80][:number_of_ofdm_symbols]
+    fft_outputs = (1/64) * np.fft.fft(ofdm_symbols, axis=1)
 
-    for i in range(number_of_ofdm_symbols):
-        start = (i * 80) + lt_peak_position + 64 + 16
-        stop = start + 64
+    corrected_symbols = np.zeros(48 * number_of_ofdm_symbols, dtype=complex)
 
-        if stop > len(rx_waveform_20mhz):
-            logging.info(f"Símbolo {i+1} fora dos limites. Interrompendo o processamento.")
-            corrected_symbols = corrected_symbols[:i*48]  # Trunca para os símbolos processados
-            break
+    # Buffers de 64 subportadoras reaproveitados a cada símbolo, para que o laço
+    # não aloque um vetor novo a cada etapa da correção.
+    equalized_symbol = np.empty(64, dtype=complex)
+    corrected_symbol1 = np.empty(64, dtype=complex)
 
-        current_ofdm_symbol = rx_waveform_20mhz[start:stop]
-        current_fft_output = (1/64) * np.fft.fft(current_ofdm_symbol)
-        equalized_symbol = current_fft_output * equalizer_coefficients
+    for i in range(number_of_ofdm_symbols):
+        current_fft_output = fft_outputs[i]
+        np.multiply(current_fft_output, equalizer_coefficients, out=equalized_symbol)
 
         # Remove a polaridade esperada dos pilotos antes de estimar fase. A ordem
         # precisa permanecer a mesma de `PILOT_CARRIERS`: -21, -7, 7, 21.
         # TAREFA DO ALUNO: extraia os pilotos equalizados e remova a polaridade
-        # conhecida do símbolo OFDM atual.
+        # conhecida do símbolo OFDM atual. Os valores esperados dos pilotos já
+        # estão pré-calculados em `PILOT_REF` (`common.py`), uma linha por posição
+        # da sequência de polaridade; não é preciso refazer o produto a cada símbolo.
         pilots = np.ones(4, dtype=complex)
 
         # Soma vetorial ponderada dos pilotos derotados. Com pesos iguais, isso
@@ -308,15 +350,16 @@ def ofdm_receiver(rx_waveform_20mhz, sample_advance, correct_frequency_offset,
         # TAREFA DO ALUNO: estime o ângulo do piloto médio.
         theta = 0.0
 
-        # Derotação comum da constelação.
-        derotation_scalar = np.exp(-1j * theta)
-        corrected_symbol1 = equalized_symbol * derotation_scalar
+        # Derotação comum da constelação. Para um escalar, `cmath.rect(1, -theta)`
+        # calcula exp(-j*theta) diretamente por cos/sin, sem passar pelo NumPy.
+        derotation_scalar = cmath.rect(1.0, -theta)
+        np.multiply(equalized_symbol, derotation_scalar, out=corrected_symbol1)
 
         # Integra lentamente a correção comum no equalizador para suavizar o
         # rastreamento de fase entre símbolos. Esta etapa não é exigida pela
         # norma; é uma escolha de implementação para evitar que o erro residual
         # volte a crescer logo após a derotação do símbolo atual.
-        equalizer_coefficients *= np.exp(-1j * theta / L)
+        equalizer_coefficients *= cmath.rect(1.0, -theta / L)
 
         # Erro de temporização residual aparece como inclinação de fase versus
         # frequência. Dividir a fase de cada piloto pelo índice da subportadora
@@ -329,29 +372,39 @@ def ofdm_receiver(rx_waveform_20mhz, sample_advance, correct_frequency_offset,
         # OFDM. Isso suaviza a estimativa, tornando-a mais robusta ao ruído.
         # Um erro de temporização muda muito lentamente, então fazer a média de várias
         # estimativas consecutivas nos dá um resultado mais estável.
-        average_slope_filter[1:] = average_slope_filter[:-1]
-        average_slope_filter[0] = slope
-        average_slope = np.sum(average_slope_filter) / min(i+1, L)
+        # O filtro é um buffer circular com soma corrente: a estimativa nova
+        # substitui a mais antiga, na posição `i % L`, e só essa diferença
+        # atualiza a soma.
+        slope_sum += slope - average_slope_filter[i % L]
+        average_slope_filter[i % L] = slope
+        average_slope = slope_sum / min(i+1, L)
 
         # Correção de fase residual entre portadoras.
-        k = np.fft.fftshift(np.arange(-32, 32))
         applied_correction = k * average_slope
 
+        # Só uma exponencial complexa por símbolo: a rotação de 1/L da correção,
+        # usada no equalizador. A rotação completa é a sua L-ésima potência, que
+        # o NumPy calcula por multiplicações para expoentes inteiros pequenos.
+        partial_rotation = np.exp(-1j * applied_correction / L)
+
         # Remove a rampa de fase causada pelo erro de temporização. Um atraso
         # dentro do prefixo cíclico não destrói a ortogonalidade, mas aparece
         # como fase linear em k; por isso a correção depende do índice da
         # subportadora e não é o mesmo escalar usado para `theta`.
-        corrected_symbol2 = corrected_symbol1 * np.exp(-1j * applied_correction)
+        corrected_symbol2 = partial_rotation ** L
+        corrected_symbol2 *= corrected_symbol1
 
         # Suaviza a correção de temporização ao longo dos próximos símbolos.
         # Em um receptor completo, essa informação poderia também dirigir um
         # interpolador de temporização; aqui ela é absorvida no equalizador.
-        equalizer_coefficients *= np.exp(-1j * applied_correction / L)
+        equalizer_coefficients *= partial_rotation
 
         start_corr = i * 48
         stop_corr = start_corr + 48
 
-        corrected_symbols[start_corr:stop_corr] = corrected_symbol2[DATA_CARRIERS_IDX]
+        # Copia as 48 subportadoras de dados direto para a saída, sem o vetor
+        # temporário que `corrected_symbol2[DATA_CARRIERS_IDX]` criaria.
+        np.take(corrected_symbol2, DATA_CARRIERS_IDX, out=corrected_symbols[start_corr:stop_corr])
 
     return corrected_symbols
 
@@ -402,26 +455,27 @@ def decode_signal_field(signal_symbol_iq: np.ndarray) -> dict:
     params['raw_bits'] = decoded_bits
 
     # Os bits são transmitidos LSB primeiro nos campos RATE e LENGTH.
-    # Precisamos inverter a ordem para a conversão para inteiro.
+    # A conversão para inteiro é um produto escalar com os pesos de cada bit.
 
-    # Bits 0-3: RATE
+    # Bits 0-3: RATE. As chaves de `RATE_MAP` seguem a ordem R1-R4 da norma,
+    # com R1 como bit mais significativo.
     rate_bits = decoded_bits[0:4]
-    rate_val = int("".join(map(str, rate_bits)), 2)
+    rate_val = int(rate_bits @ _RATE_BIT_WEIGHTS)
     params['rate_info'] = RATE_MAP.get(rate_val, {'name': 'Invalid Rate', 'Mbps': 0})
 
     # Bit 4: Reservado (deve ser 0)
 
-    # Bits 5-16: LENGTH (12 bits)
+    # Bits 5-16: LENGTH (12 bits, LSB primeiro)
     length_bits = decoded_bits[5:17]
-    params['length'] = int("".join(map(str, length_bits[::-1])), 2)
+    params['length'] = int(length_bits @ _LENGTH_BIT_WEIGHTS)
 
     # Bit 17: Paridade par para os primeiros 17 bits (0-16)
-    parity_calc = np.sum(decoded_bits[0:17]) % 2
+    parity_calc = np.bitwise_xor.reduce(decoded_bits[0:17])
     parity_recv = decoded_bits[17]
     params['parity_ok'] = (parity_calc == parity_recv)
 
     # Bits 18-23: Cauda (devem ser 0)
-    params['tail_ok'] = not np.any(decoded_bits[18:24])
+    params['tail_ok'] = not decoded_bits[18:24].any()
 
     return params
 
@@ -462,7 +516,9 @@ def decode_data_symbols(data_symbols_iq: np.ndarray, rate_info: dict, psdu_lengt
     deinterleave_pattern = create_deinterleaving_pattern(n_cbps, n_bpsc)
 
     deinterleaved_matrix = soft_bits_matrix[:, deinterleave_pattern]
-    deinterleaved_soft_bits = deinterleaved_matrix.flatten()
+    # A indexação avançada já produz uma matriz nova e contígua; `ravel`
+    # devolve uma visão dela, sem a cópia extra que `flatten` faria.
+    deinterleaved_soft_bits = deinterleaved_matrix.ravel()
 
     # --- PASSO 3: Decodificação Viterbi ---
     # O número total de bits codificados = SERVICE (16) + PSDU (8*len) + TAIL (6)
@@ -477,7 +533,7 @@ def decode_data_symbols(data_symbols_iq: np.ndarray, rate_info: dict, psdu_lengt
 
     # Executa o algoritmo de Viterbi
     decoded_scrambled_bits = convolutional_decoder(viterbi_input)
-    tail_ok = not np.any(decoded_scrambled_bits[-6:])
+    tail_ok = not decoded_scrambled_bits[-6:].any()
 
     # --- PASSO 4: Descrambling ---
     descrambled_bits = descramble(decoded_scrambled_bits)
@@ -492,15 +548,12 @@ def decode_data_symbols(data_symbols_iq: np.ndarray, rate_info: dict, psdu_lengt
 
     # Separa os dados do CRC
     mac_frame_bytes = psdu_with_crc_bytes[:-4]
-    received_crc_bytes = psdu_with_crc_bytes[-4:]
-
-    # O CRC32 do 802.11 é padrão, mas o resultado é complementado
-    calculated_crc = binascii.crc32(mac_frame_bytes) & 0xFFFFFFFF
-
-    # Converte o CRC recebido (little-endian) para um inteiro
-    received_crc = int.from_bytes(received_crc_bytes, byteorder='little')
 
-    crc_ok = (calculated_crc == received_crc)
+    # O CRC32 do 802.11 é padrão, mas o resultado é complementado. Em vez de
+    # converter os 4 bytes recebidos para inteiro e compará-los com o CRC dos
+    # dados, calcula-se o CRC do PSDU inteiro: ele vale o resíduo fixo
+    # 0x2144DF1C se e somente se o CRC recebido (little-endian) estiver correto.
+    crc_ok = (binascii.crc32(psdu_with_crc_bytes) == _CRC32_RESIDUE)
 
     return mac_frame_bytes, tail_ok, crc_ok
 
@@ -576,8 +629,10 @@ def create_deinterleaving_pattern(n_cbps, n_bpsc):
     Referência interna: inverso de `create_interleaving_pattern()` em
     `ieee80211ag/tx.py`.
     """
-    if (n_cbps, n_bpsc) in _DEINTERLEAVING_PATTERNS:
-        return _DEINTERLEAVING_PATTERNS[(n_cbps, n_bpsc)]
+    key = (int(n_cbps), int(n_bpsc))
+    deinterleave_pattern = _DEINTERLEAVING_PATTERNS.get(key)
+    if deinterleave_pattern is not None:
+        return deinterleave_pattern
 
     # Primeira permutação da norma, expressa em função do índice original `k`.
     # TAREFA DO ALUNO: implemente as duas permutações do interleaver e combine-as
@@ -587,7 +642,11 @@ def create_deinterleaving_pattern(n_cbps, n_bpsc):
     # o padrão que desfaz essa reordenação quando aplicado aos soft bits recebidos.
     deinterleave_pattern = np.arange(n_cbps)
 
-    _DEINTERLEAVING_PATTERNS[(n_cbps, n_bpsc)] = deinterleave_pattern
+    # O padrão em cache é compartilhado por todos os quadros: guarda uma cópia
+    # como `np.intp`, o tipo de índice do NumPy, e somente leitura.
+    deinterleave_pattern = np.array(deinterleave_pattern, dtype=np.intp)
+    deinterleave_pattern.setflags(write=False)
+    _DEINTERLEAVING_PATTERNS[key] = deinterleave_pattern
     return deinterleave_pattern
 
 def demapper_ofdm(symbols_iq, n_bpsc):
@@ -615,7 +674,9 @@ def demapper_ofdm(symbols_iq, n_bpsc):
         return np.zeros(len(symbols_iq), dtype=float)
     if n_bpsc == 2:
         # TAREFA DO ALUNO: para QPSK, intercale componentes I e Q na ordem
-        # [I0, Q0, I1, Q1, ...]. `np.column_stack(...).ravel()` é uma forma
-        # compacta de transformar dois vetores I/Q em um único fluxo intercalado.
+        # [I0, Q0, I1, Q1, ...]. Uma forma direta é alocar a saída com
+        # `np.empty` e preencher as posições pares e ímpares com fatias de passo
+        # 2 (`[0::2]` e `[1::2]`); `np.column_stack(...).ravel()` também funciona,
+        # mas monta uma matriz temporária antes do fluxo intercalado.
         return np.zeros(2 * len(symbols_iq), dtype=float)
     raise ValueError(f"n_bpsc={n_bpsc} not supported")
@@ -4,12 +4,34 @@
 
 import numpy as np
 import binascii
+from scipy.signal import lfilter
+from scipy.signal.windows import hann
+from numba import njit
 
 from .bcc import encode_bits
 from .common import *
 
 _INTERLEAVING_PATTERNS = {} # Cache para os padrões
 
+# Fator de normalização K_MOD de cada modulação, indexado por N_BPSC.
+_MODULATION_SCALE = {1: K_BPSK, 2: K_QPSK, 4: K_QAM16, 6: K_QAM64}
+
+def _make_half_band_filter(N=31):
+    """
+    Calcula os coeficientes do filtro de meia banda usado no upsampling por 2
+    do transmissor sem IFFT de 128 pontos. Um filtro de meia banda é eficiente
+    para interpolação por um fator de 2.
+    Referência: Livro-texto, Seção 7.2.7, "The Upsampling Process",
+    Figura 7-35; ver também a Seção 3.4.3, "The Half-Band Filter".
+    """
+    n = np.arange(N)
+    arg = n / 2 - (N - 1) / 4
+    return np.sinc(arg) * (hann(N + 2, sym=False)[1:N+1]**0.5)
+
+# Os coeficientes são constantes, então são calculados uma única vez.
+_HALF_BAND_FILTER = _make_half_band_filter()
+_HALF_BAND_FILTER.setflags(write=False)
+
 def ofdm_transmitter(mac_frame_bytes, rate_key=0b0101, transmitter_choice=1):
     """
     Gera uma forma de onda de pacote 802.11a/g completa, incluindo os campos
@@ -17,8 +39,11 @@ def ofdm_transmitter(mac_frame_bytes, rate_key=0b0101, transmitter_choice=1):
     Referência: Livro-texto, Seção 7.2.2, Figura 7-17 (visão geral do transmissor).
     """
     # 1. Incluir CRC ao final de mac_frame_bytes para obter psdu_bytes
+    # O PSDU fica como vetor `uint8`; `encode_data_field` o lê por
+    # `np.frombuffer`, sem cópia e sem um objeto `bytes` intermediário.
     crc = (binascii.crc32(mac_frame_bytes) & 0xFFFFFFFF).to_bytes(4, 'little')
-    psdu_bytes = np.concatenate((mac_frame_bytes, np.frombuffer(crc, dtype=np.uint8))).tobytes()
+    psdu_bytes = np.concatenate((np.frombuffer(mac_frame_bytes, dtype=np.uint8),
+                                 np.frombuffer(crc, dtype=np.uint8)))
 
     # 2. Obter preâmbulo (sequências de treinamento curta e longa).
     # A escolha do passo (step) determina a taxa de amostragem (20MHz ou 40MHz).
@@ -45,17 +70,8 @@ def ofdm_transmitter(mac_frame_bytes, rate_key=0b0101, transmitter_choice=1):
         packet_zero_stuffed = np.zeros(2 * len(packet), dtype=complex)
         packet_zero_stuffed[::2] = packet
 
-        # Calcular coeficientes do filtro de meia banda.
-        # Um filtro de meia banda é eficiente para interpolação por um fator de 2.
-        # Referência: Livro-texto, Seção 7.2.7, "The Upsampling Process",
-        # Figura 7-35; ver também a Seção 3.4.3, "The Half-Band Filter".
-        N = 31
-        n = np.arange(N)
-        arg = n / 2 - (N - 1) / 4
-        h = np.sinc(arg) * (hann(N + 2, sym=False)[1:N+1]**0.5)
-
         # Operação de filtragem de meia banda para completar o upsampling.
-        packet = lfilter(h, [1.0], np.concatenate((packet_zero_stuffed, np.zeros(100))))
+        packet = lfilter(_HALF_BAND_FILTER, [1.0], np.concatenate((packet_zero_stuffed, np.zeros(100))))
 
     return packet, np.concatenate((signal_symbols, data_symbols))
 
@@ -67,25 +83,29 @@ def create_signal_field(psdu_length_bytes, rate_key=0b0101):
     Referência interna: decodificação em `ieee80211ag/rx.py`, função
     `decode_signal_field`.
     """
-    # Bits 0-3: RATE
-    rate_bits = np.array([int(b) for b in format(rate_key, '04b')])
+    psdu_length_bytes = int(psdu_length_bytes)
+    if not 0 <= psdu_length_bytes <= 0xFFF:
+        raise ValueError(f"psdu_length_bytes={psdu_length_bytes} does not fit the 12-bit LENGTH field")
 
-    # Bit 4: Reservado
-    reserved_bit = np.array([0])
+    # Os 24 bits são montados em uma única palavra inteira, com o bit 0 da
+    # palavra sendo o primeiro bit transmitido.
 
-    # Bits 5-16: LENGTH (12 bits, LSB primeiro)
-    length_bits = np.array([int(b) for b in format(psdu_length_bytes, '012b')[::-1]])
+    # Bits 0-3: RATE (R1 a R4, R1 no bit mais significativo de `rate_key`,
+    # por isso a ordem dos 4 bits é invertida)
+    rate_key = int(rate_key)
+    info_word = sum(((rate_key >> (3 - b)) & 1) << b for b in range(4))
 
-    # Monta os primeiros 17 bits
-    info_bits = np.concatenate((rate_bits, reserved_bit, length_bits))
+    # Bit 4: Reservado (zero)
 
-    # Bit 17: Paridade par para os primeiros 17 bits (0-16)
-    parity = np.sum(info_bits) % 2
+    # Bits 5-16: LENGTH (12 bits, LSB primeiro)
+    info_word |= psdu_length_bytes << 5
 
-    # Bits 18-23: Cauda de zeros
-    tail_bits = np.zeros(6, dtype=int)
+    # Bit 17: Paridade par para os primeiros 17 bits (0-16)
+    parity = info_word.bit_count() & 1
 
-    signal_field_24_bits = np.concatenate((info_bits, [parity], tail_bits))
+    # Bits 18-23: Cauda de zeros (já nulos na palavra). Os bits são `uint8`,
+    # como os do campo DATA.
+    signal_field_24_bits = (((info_word | (parity << 17)) >> np.arange(24)) & 1).astype(np.uint8)
 
     # Codificação convolucional (sempre taxa 1/2) -> 48 bits
     encoded_bits = convolutional_encoder(signal_field_24_bits)
@@ -93,11 +113,44 @@ def create_signal_field(psdu_length_bytes, rate_key=0b0101):
     # Interleaving (sempre BPSK, n_bpsc=1, n_cbps=48)
     interleaved_bits = interleave(encoded_bits, 48, 1)
 
-    # Mapeamento BPSK
-    signal_symbols = 2 * interleaved_bits - 1
+    # Mapeamento BPSK pela LUT de níveis (os bits são `uint8`, então `2*b - 1`
+    # daria a volta em vez de produzir -1)
+    signal_symbols = BPSK_LEVELS[interleaved_bits]
 
     return signal_symbols
 
+@njit(cache=True)
+def _interleave_map_numba(encoded_bits, pattern, n_bpsc, scale):
+    """Interleaving e mapeamento de constelação fundidos, compilados com Numba.
+
+    Para cada símbolo OFDM, lê os bits codificados já na ordem do padrão de
+    interleaving e monta diretamente o ponto da constelação, com a mesma regra
+    de `mapper_ofdm`, sem materializar o vetor de bits entrelaçados.
+    """
+    n_cbps = pattern.shape[0]
+    num_ofdm_symbols = encoded_bits.shape[0] // n_cbps
+    carriers_per_symbol = n_cbps // n_bpsc
+    bits_per_axis = max(n_bpsc // 2, 1)
+    max_level = (1 << bits_per_axis) - 1
+    output = np.empty(num_ofdm_symbols * carriers_per_symbol, dtype=np.complex128)
+
+    for symbol in range(num_ofdm_symbols):
+        base = symbol * n_cbps
+        for carrier in range(carriers_per_symbol):
+            first = carrier * n_bpsc
+            idx_i = 0
+            for b in range(bits_per_axis):
+                idx_i = (idx_i << 1) | encoded_bits[base + pattern[first + b]]
+            level_q = 0
+            if n_bpsc > 1:
+                idx_q = 0
+                for b in range(bits_per_axis):
+                    idx_q = (idx_q << 1) | encoded_bits[base + pattern[first + bits_per_axis + b]]
+                level_q = 2 * idx_q - max_level
+            output[symbol * carriers_per_symbol + carrier] = scale * ((2 * idx_i - max_level) + 1j * level_q)
+
+    return output
+
 def encode_data_field(psdu_bytes, rate_key=0b0101):
     """
     Codifica o campo de dados (PSDU) em símbolos OFDM na taxa escolhida.
@@ -105,22 +158,25 @@ def encode_data_field(psdu_bytes, rate_key=0b0101):
     Referência interna: decodificação em `ieee80211ag/rx.py`, função
     `decode_data_symbols`.
     """
-    rate_params = RATE_MAP[rate_key]
-    n_dbps = rate_params['n_dbps']
-    n_cbps = rate_params['n_cbps']
-    n_bpsc = rate_params['n_bpsc']
-
-    # Monta o campo DATA: SERVICE (16 bits) + PSDU + TAIL (6 bits)
-    service_bits = np.zeros(16, dtype=int)
+    if not RATE_VALID[rate_key]:
+        raise ValueError(f"rate_key={rate_key:#06b} not supported")
+    n_dbps = int(N_DBPS[rate_key])
+    n_cbps = int(N_CBPS[rate_key])
+    n_bpsc = int(N_BPSC[rate_key])
+
+    # Monta o campo DATA: SERVICE (16 bits) + PSDU + TAIL (6 bits). Os bits
+    # são mantidos em `uint8`, o mesmo tipo de `np.unpackbits`, do scrambler e
+    # do codificador convolucional, para evitar promoções a inteiros de 64 bits.
+    service_bits = np.zeros(16, dtype=np.uint8)
     psdu_bits = np.unpackbits(np.frombuffer(psdu_bytes, dtype=np.uint8), bitorder='little')
-    tail_bits = np.zeros(6, dtype=int)
+    tail_bits = np.zeros(6, dtype=np.uint8)
 
     total_data_bits = len(service_bits) + len(psdu_bits) + len(tail_bits)
     num_ofdm_symbols = int(np.ceil(total_data_bits / n_dbps))
 
     # Adiciona bits de preenchimento (padding) para completar o último símbolo OFDM.
     num_pad_bits = num_ofdm_symbols * n_dbps - total_data_bits
-    pad_bits = np.zeros(num_pad_bits, dtype=int)
+    pad_bits = np.zeros(num_pad_bits, dtype=np.uint8)
 
     data_to_encode = np.concatenate((service_bits, psdu_bits, tail_bits, pad_bits))
 
@@ -135,18 +191,12 @@ def encode_data_field(psdu_bytes, rate_key=0b0101):
 
     # Puncturing poderia ser adicionado aqui para taxas de código > 1/2
 
-    # Interleaving e Mapeamento por símbolo OFDM
-    data_symbols = np.array([], dtype=complex)
-    for i in range(num_ofdm_symbols):
-        start, stop = i * n_cbps, (i + 1) * n_cbps
-        symbol_encoded_bits = encoded_bits[start:stop]
-
-        symbol_interleaved_bits = interleave(symbol_encoded_bits, n_cbps, n_bpsc)
-
-        # Mapeia os bits entrelaçados para a constelação apropriada.
-        symbol = mapper_ofdm(symbol_interleaved_bits, n_bpsc)
-
-        data_symbols = np.concatenate((data_symbols, symbol))
+    # Interleaving por símbolo OFDM e mapeamento para a constelação apropriada,
+    # fundidos num único laço: o mesmo que `mapper_ofdm(interleave(...), n_bpsc)`
+    # aplicado a cada bloco de N_CBPS bits.
+    data_symbols = _interleave_map_numba(encoded_bits[:num_ofdm_symbols * n_cbps],
+                                         create_interleaving_pattern(n_cbps, n_bpsc),
+                                         n_bpsc, float(_MODULATION_SCALE[n_bpsc]))
 
     return data_symbols
 
@@ -156,8 +206,9 @@ def convolutional_encoder(bits):
     Referência: Norma IEEE 802.11a, Seção 17.3.5.5.
     Referência Livro-texto: Seção 5.6.3.
     Referência gr-ieee802-11: `lib/utils.cc`, função `convolutional_encoding`.
+    Devolve um vetor `uint8`, dois bits codificados por bit de entrada.
     """
-    return np.array(encode_bits(bits), dtype=int)
+    return encode_bits(bits)
 
 def create_interleaving_pattern(n_cbps, n_bpsc):
     """
@@ -175,12 +226,11 @@ def create_interleaving_pattern(n_cbps, n_bpsc):
     k = np.arange(n_cbps)
     i = (n_cbps // 16) * (k % 16) + (k // 16)
 
-    # Segunda permutação (inversa de j para i)
+    # Segunda permutação (inversa de j para i), avaliada para todos os índices
+    # de uma vez.
     s = max(n_bpsc // 2, 1)
-    interleave_map = np.zeros(n_cbps, dtype=int)
-    for i_idx in range(n_cbps):
-        j = s * (i_idx // s) + (i_idx + n_cbps - (16 * i_idx // n_cbps)) % s
-        interleave_map[i_idx] = j
+    i_idx = np.arange(n_cbps)
+    interleave_map = s * (i_idx // s) + (i_idx + n_cbps - (16 * i_idx // n_cbps)) % s
 
     pattern = np.argsort(interleave_map[i])
     _INTERLEAVING_PATTERNS[(n_cbps, n_bpsc)] = pattern
@@ -199,34 +249,25 @@ def mapper_ofdm(input_bits, n_bpsc):
     Referência Norma IEEE 802.11a: Seção 17.3.5.7 e Tabela 81.
     Referência gr-ieee802-11: `lib/constellations_impl.cc`.
     """
+    if n_bpsc not in _MODULATION_SCALE:
+        raise ValueError(f"n_bpsc={n_bpsc} not supported")
     num_symbols = len(input_bits) // n_bpsc
-    output_symbols = np.zeros(num_symbols, dtype=complex)
-
-    # Itera sobre os grupos de bits e mapeia para os símbolos correspondentes.
-    for i in range(num_symbols):
-        start = i * n_bpsc
-        stop = start + n_bpsc
-        bit_group = input_bits[start:stop]
-
-        if n_bpsc == 1: # BPSK
-            symbol = BPSK_LUT[bit_group[0]]
-        elif n_bpsc == 2: # QPSK
-            symbol = QPSK_LUT[bit_group[0]] + 1j * QPSK_LUT[bit_group[1]]
-        elif n_bpsc == 4: # 16-QAM
-            # O mapeamento Gray é usado para minimizar erros de bit.
-            idx_i = bit_group[0] * 2 + bit_group[1]
-            idx_q = bit_group[2] * 2 + bit_group[3]
-            symbol = QAM16_LUT[idx_i] + 1j * QAM16_LUT[idx_q]
-        elif n_bpsc == 6: # 64-QAM
-            idx_i = bit_group[0] * 4 + bit_group[1] * 2 + bit_group[2]
-            idx_q = bit_group[3] * 4 + bit_group[4] * 2 + bit_group[5]
-            symbol = QAM64_LUT[idx_i] + 1j * QAM64_LUT[idx_q]
-        else:
-            raise ValueError(f"n_bpsc={n_bpsc} not supported")
-
-        output_symbols[i] = symbol
-
-    return output_symbols
+    bits = np.asarray(input_bits[:num_symbols * n_bpsc]).reshape(num_symbols, n_bpsc)
+
+    # Cada eixo recebe metade dos bits do símbolo (no BPSK, o único bit vai
+    # para I). O índice de nível é o valor binário desses bits, MSB primeiro,
+    # e o nível inteiro correspondente é `2*idx - (2**k - 1)`, isto é, a LUT
+    # {-1, 1}, {-3, -1, 1, 3} ou {-7, ..., 7} de `common.py`. Todas as
+    # modulações usam a mesma expressão vetorizada, e o fator K_MOD é
+    # aplicado uma única vez.
+    bits_per_axis = max(n_bpsc // 2, 1)
+    weights = 1 << np.arange(bits_per_axis - 1, -1, -1)
+    max_level = (1 << bits_per_axis) - 1
+    level_i = 2 * (bits[:, :bits_per_axis] @ weights) - max_level
+    if n_bpsc == 1:
+        return (_MODULATION_SCALE[n_bpsc] * level_i).astype(complex)
+    level_q = 2 * (bits[:, bits_per_axis:] @ weights) - max_level
+    return _MODULATION_SCALE[n_bpsc] * (level_i + 1j * level_q)
 
 def ifft_gi(symbol_stream, start_symbol_index=0):
     """
@@ -238,29 +279,29 @@ def ifft_gi(symbol_stream, start_symbol_index=0):
     `digital_ofdm_carrier_allocator_cvc`.
     """
     num_symbols = len(symbol_stream) // 48
-    payload = np.zeros(num_symbols * 80, dtype=complex)
-    ifft_input = np.zeros(64, dtype=complex)
 
-    for i in range(num_symbols):
-        # A polaridade dos pilotos muda a cada símbolo para espalhar a energia.
-        symbol_idx = start_symbol_index + i
-
-        start_symbol, stop_symbol = i * 48, (i + 1) * 48
-        ifft_input[:] = 0
-        ifft_input[DATA_CARRIERS_IDX] = symbol_stream[start_symbol:stop_symbol]
-        # Os pilotos são modulados por BPSK e multiplicados pela polaridade.
-        ifft_input[PILOT_CARRIERS_IDX] = PILOT_BASE_POLARITY * PILOT_POLARITY[symbol_idx % 127]
-
-        # A IFFT converte o sinal do domínio da frequência para o domínio do tempo.
-        ifft_output = np.fft.ifft(ifft_input)
-
-        # Adiciona o Intervalo de Guarda (GI) ou Prefixo Cíclico.
-        # O GI é uma cópia das últimas 16 amostras do símbolo IFFT, prefixado ao símbolo.
-        # Isso mitiga a interferência intersimbólica (ISI) causada por múltiplos percursos.
-        start_payload, stop_payload = i * 80, (i + 1) * 80
-        payload[start_payload:stop_payload] = 64 * np.concatenate((ifft_output[48:], ifft_output))
-
-    return payload
+    # Todos os símbolos são montados numa matriz (num_symbols, 64), uma linha
+    # por símbolo OFDM, e transformados com uma única chamada à IFFT.
+    ifft_input = np.zeros((num_symbols, 64), dtype=complex)
+    ifft_input[:, DATA_CARRIERS_IDX] = np.reshape(symbol_stream[:num_symbols * 48], (num_symbols, 48))
+    # Os pilotos são modulados por BPSK e multiplicados pela polaridade, que
+    # muda a cada símbolo para espalhar a energia.
+    symbol_idx = start_symbol_index + np.arange(num_symbols)
+    ifft_input[:, PILOT_CARRIERS_IDX] = PILOT_REF[symbol_idx % 127]
+
+    # A IFFT converte o sinal do domínio da frequência para o domínio do tempo.
+    # Com `norm="forward"` a IFFT não divide por 64, o que equivale ao antigo
+    # `64 * np.fft.ifft(...)`, e `out=` grava o resultado direto na parte útil
+    # de cada linha do payload, sem matriz intermediária.
+    payload = np.empty((num_symbols, 80), dtype=complex)
+    np.fft.ifft(ifft_input, axis=1, norm="forward", out=payload[:, 16:])
+
+    # Adiciona o Intervalo de Guarda (GI) ou Prefixo Cíclico.
+    # O GI é uma cópia das últimas 16 amostras do símbolo IFFT, prefixado ao símbolo.
+    # Isso mitiga a interferência intersimbólica (ISI) causada por múltiplos percursos.
+    payload[:, :16] = payload[:, 64:]
+
+    return payload.ravel()
 
 def ifft128_gi(symbol_stream, start_symbol_index=0):
     """
@@ -270,25 +311,22 @@ def ifft128_gi(symbol_stream, start_symbol_index=0):
     Referência: Livro-texto, Seção 7.2.8.
     """
     num_symbols = len(symbol_stream) // 48
-    payload = np.zeros(num_symbols * 160, dtype=complex)
-    ifft64_input = np.zeros(64, dtype=complex)
-    ifft128_input = np.zeros(128, dtype=complex)
-
-    for i in range(num_symbols):
-        symbol_idx = start_symbol_index + i
 
-        start_symbol, stop_symbol = i * 48, (i + 1) * 48
-        ifft64_input[:] = 0
-        ifft64_input[DATA_CARRIERS_IDX] = symbol_stream[start_symbol:stop_symbol]
-        ifft64_input[PILOT_CARRIERS_IDX] = PILOT_BASE_POLARITY * PILOT_POLARITY[symbol_idx % 127]
+    ifft64_input = np.zeros((num_symbols, 64), dtype=complex)
+    ifft64_input[:, DATA_CARRIERS_IDX] = np.reshape(symbol_stream[:num_symbols * 48], (num_symbols, 48))
+    symbol_idx = start_symbol_index + np.arange(num_symbols)
+    ifft64_input[:, PILOT_CARRIERS_IDX] = PILOT_REF[symbol_idx % 127]
 
-        ifft128_input[:] = 0
-        # Mapeia as 64 subportadoras nas posições correspondentes da IFFT de 128 pontos.
-        ifft128_input[np.concatenate((np.arange(32), np.arange(96, 128)))] = ifft64_input
+    # Mapeia as 64 subportadoras nas posições correspondentes da IFFT de 128
+    # pontos: as frequências positivas (0 a 31) no início e as negativas (-32
+    # a -1) no fim, com zeros no meio.
+    ifft128_input = np.zeros((num_symbols, 128), dtype=complex)
+    ifft128_input[:, :32] = ifft64_input[:, :32]
+    ifft128_input[:, 96:] = ifft64_input[:, 32:]
 
-        ifft_output = np.fft.ifft(ifft128_input)
-        # O GI agora tem 32 amostras para manter a duração do símbolo (4us a 40 MS/s).
-        start_payload, stop_payload = i * 160, (i + 1) * 160
-        payload[start_payload:stop_payload] = 128 * np.concatenate((ifft_output[96:], ifft_output))
+    payload = np.empty((num_symbols, 160), dtype=complex)
+    np.fft.ifft(ifft128_input, axis=1, norm="forward", out=payload[:, 32:])
+    # O GI agora tem 32 amostras para manter a duração do símbolo (4us a 40 MS/s).
+    payload[:, :32] = payload[:, 128:]
 
-    return payload
+    return payload.ravel()
@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+
+from ieee80211ag.channel import cause_timing_drift, phase_noise_generator, iq_imbalance, _apply_pointwise_defects, DEFECT_SETTINGS
+
+class ChannelTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(42)
+        np.random.seed(42)  # for phase_noise_generator
+
+    def test_timing_drift_output_length(self):
+        x = (self.rng.normal(size=4000) + 1j*self.rng.normal(size=4000)).astype(np.complex64)
+        for drift in (0, -80, 80, 7, 12.3, -12.3):
+            with self.subTest(drift=drift):
+                expected_length = int(np.floor((len(x) - 1) / (1 + drift / 1e6))) + 1
+                y = cause_timing_drift(x, drift)
+                self.assertEqual(len(y), expected_length)
+                self.assertTrue(np.all(np.isfinite(y)))
+
+    def test_timing_drift_matches_analytic_tone(self):
+        # Tom complexo de 0.05 ciclo/amostra: a saída deve ser o mesmo tom
+        # amostrado em `m * (1 + drift/1e6)`. As bordas, onde o filtro vê
+        # zeros, são descartadas. -80 ppm usa o filtro polifásico; 20 e
+        # 12.3 ppm, o banco de atraso fracionário; 0 ppm, a cópia direta.
+        n = np.arange(20000)
+        f = 0.05
+        x = np.exp(2j*np.pi*f*n).astype(np.complex64)
+        for drift in (-80, 80, 20, -20, 12.3, 0):
+            with self.subTest(drift=drift):
+                y = cause_timing_drift(x, drift)
+                t = np.arange(len(y)) * (1 + drift / 1e6)
+                expected = np.exp(2j*np.pi*f*t)
+                error = np.abs(y - expected)[200:-200]
+                self.assertLess(np.max(error), 1e-2)
+
+    def test_timing_drift_zero_is_identity(self):
+        x = (self.rng.normal(size=1000) + 1j*self.rng.normal(size=1000)).astype(np.complex64)
+        np.testing.assert_array_equal(cause_timing_drift(x, 0), x)
+
+    def test_pointwise_kernel_matches_iq_imbalance(self):
+        x = (self.rng.normal(size=1000) + 1j*self.rng.normal(size=1000)).astype(np.complex64)
+        phase_imbalance, i_gain, q_gain = np.pi / 2000, 10**(-0.05/20), 10**(0.05/20)
+        expected = iq_imbalance(x, phase_imbalance, i_gain, q_gain)
+        y = _apply_pointwise_defects(x, np.zeros(0), 0.0, i_gain, q_gain, phase_imbalance)
+        np.testing.assert_allclose(y, expected, rtol=1e-5, atol=1e-5)
+
+    def test_phase_noise_at_4mhz(self):
+        profile = DEFECT_SETTINGS['PhaseNoiseProfile']
+        out, _ = phase_noise_generator(4e6, 1000, profile[1, :], profile[0, :])
+        self.assertEqual(len(out), 1000)
+
+if __name__ == '__main__':
+    unittest.main()
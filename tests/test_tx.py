@@ -0,0 +1,24 @@
+import unittest
+import numpy as np
+
+from ieee80211ag.common import K_BPSK, K_QPSK, K_QAM16, K_QAM64
+from ieee80211ag.tx import _interleave_map_numba, create_interleaving_pattern, interleave, mapper_ofdm
+
+class TxTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(42)
+
+    def test_fused_interleave_map_matches_mapper(self):
+        num_ofdm_symbols = 7
+        for n_bpsc, scale in ((1, K_BPSK), (2, K_QPSK), (4, K_QAM16), (6, K_QAM64)):
+            with self.subTest(n_bpsc=n_bpsc):
+                n_cbps = 48 * n_bpsc
+                bits = self.rng.integers(0, 2, num_ofdm_symbols * n_cbps, dtype=np.uint8)
+                interleaved_bits = np.concatenate([interleave(symbol_bits, n_cbps, n_bpsc)
+                                                   for symbol_bits in bits.reshape(num_ofdm_symbols, n_cbps)])
+                expected = mapper_ofdm(interleaved_bits, n_bpsc)
+                actual = _interleave_map_numba(bits, create_interleaving_pattern(n_cbps, n_bpsc), n_bpsc, scale)
+                np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-12)
+
+if __name__ == '__main__':
+    unittest.main()